@@ -0,0 +1,67 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from Detect import detect_objects_batch
+from Postprocess import DetectOptions, filter_results
+
+class BatchScheduler:
+    """Собирает изображения из очереди в пакеты и прогоняет их через модель одним вызовом."""
+
+    def __init__(self, processor, model, device, max_batch_size=8, max_wait=0.01):
+        self.processor = processor
+        self.model = model
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Запускает фоновый поток инференса (повторный вызов ничего не делает)."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="batch-scheduler", daemon=True)
+                self._thread.start()
+
+    def submit(self, prepared, options=DetectOptions()):
+        """Ставит подготовленное изображение (PreparedImage) в очередь и возвращает Future с результатом детекции."""
+        future = Future()
+        self._queue.put((prepared, options, future))
+        return future
+
+    def _collect(self):
+        # Ждём первое изображение, затем добираем пакет в пределах окна ожидания
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = [item for item in self._collect() if item[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            images = [prepared.image for prepared, _, _ in batch]
+            sizes = [prepared.size for prepared, _, _ in batch]
+            # Общий постпроцессинг идёт с самым низким порогом пакета, затем каждый запрос фильтруется своим
+            threshold = min(options.threshold for _, options, _ in batch)
+            try:
+                results = detect_objects_batch(images, self.processor, self.model, self.device, target_sizes=sizes, threshold=threshold)
+                results = [filter_results(result, options) for result, (_, options, _) in zip(results, batch)]
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, _, future), result in zip(batch, results):
+                future.set_result(result)
+            print(f"Processed batch of {len(batch)} image(s)")
@@ -0,0 +1,368 @@
+import argparse
+import copy
+import glob
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import torch
+from PIL import Image, ImageOps
+
+import Config
+from Detect import load_model, detect_objects_batch, draw_boxes, resize_image
+from Postprocess import LabelMap, box_iou, columns_from_results
+from Precision import apply_precision, candidate_precisions, check_precision, default_precision, model_dtype
+from Preprocess import default_resolution, prepare_image
+from Render import encode_image, render_detections
+
+def percentile(values, q):
+    """Перцентиль q (0–100) по списку значений."""
+    return float(np.percentile(values, q)) if values else 0.0
+
+def measure(fn, runs=10, warmup=2):
+    """Замеряет время вызова fn; возвращает задержки в миллисекундах (среднее, p50, p95, p99)."""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "runs": runs,
+        "mean_ms": round(float(np.mean(timings)), 2),
+        "p50_ms": round(percentile(timings, 50), 2),
+        "p95_ms": round(percentile(timings, 95), 2),
+        "p99_ms": round(percentile(timings, 99), 2),
+    }
+
+def synthetic_image_bytes(width=1280, height=960, seed=0):
+    """Синтетическое JPEG-изображение заданного размера."""
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+# Фотография с объектами (без нарисованных рамок), из которой по умолчанию делаются изображения
+# для замеров: на шуме модель ничего не находит, и постпроцессинг и отрисовка замеряют пустую работу
+SAMPLE_IMAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "samples", "astronaut.jpg")
+
+def sample_image_bytes(width=1280, height=960, source=SAMPLE_IMAGE):
+    """JPEG заданного размера, вырезанный из фотографии source; None, если её нет."""
+    if not source or not os.path.exists(source):
+        return None
+    with Image.open(source) as image:
+        image = ImageOps.fit(ImageOps.exif_transpose(image).convert("RGB"), (width, height), Image.BILINEAR)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+def default_image_bytes(width=1280, height=960):
+    """Изображение для замеров без --images: пример с объектами, а если его нет — синтетический шум."""
+    return sample_image_bytes(width, height) or synthetic_image_bytes(width, height)
+
+def load_image_bytes(paths):
+    """Байты изображений по списку файлов и каталогов (из каталога берутся jpg, jpeg, png и webp)."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for pattern in ("*.jpg", "*.jpeg", "*.png", "*.webp"):
+                files += sorted(glob.glob(os.path.join(path, pattern)))
+        else:
+            files.append(path)
+    images = []
+    for file in files:
+        with open(file, "rb") as f:
+            images.append(f.read())
+    return images
+
+def detection_agreement(reference, candidate, iou_threshold=0.8):
+    """Доля эталонных рамок, найденных в candidate с тем же классом и IoU не ниже порога."""
+    matched, total = 0, 0
+    for ref, cand in zip(reference, candidate):
+        ref_boxes, cand_boxes = ref["boxes"].float().cpu().numpy(), cand["boxes"].float().cpu().numpy()
+        ref_labels, cand_labels = ref["labels"].cpu().numpy(), cand["labels"].cpu().numpy()
+        total += len(ref_boxes)
+        if len(ref_boxes) and len(cand_boxes):
+            same_label = ref_labels[:, None] == cand_labels[None, :]
+            matched += int(((box_iou(ref_boxes, cand_boxes) >= iou_threshold) & same_label).any(axis=1).sum())
+    return round(matched / total, 4) if total else 1.0
+
+def compare_precisions(processor, model, device, image_bytes, precisions=None, runs=5, threshold=0.5):
+    """Замеряет скорость и совпадение детекций с FP32 для каждого режима точности."""
+    prepared = [prepare_image(data, default_resolution()) for data in image_bytes]
+    images, sizes = [p.image for p in prepared], [p.size for p in prepared]
+    precisions = precisions or candidate_precisions(device)
+    # FP32 всегда первым: это эталон для проверки точности остальных режимов
+    precisions = ["fp32"] + [p for p in precisions if p != "fp32"]
+
+    report, reference = [], None
+    for precision in precisions:
+        candidate = apply_precision(copy.deepcopy(model), precision).to(device)
+        run = lambda: detect_objects_batch(images, processor, candidate, device, target_sizes=sizes, threshold=threshold)
+        try:
+            with torch.inference_mode():
+                results = run()
+                stats = measure(run, runs=runs, warmup=1)
+        except (RuntimeError, NotImplementedError) as e:
+            report.append({"precision": precision, "error": str(e)})
+            continue
+        finally:
+            del candidate
+        if reference is None:
+            reference = results
+        report.append({"precision": precision, "agreement": detection_agreement(reference, results), **stats})
+        print(f"{precision}: {report[-1]}")
+    return report
+
+def select_precision(processor, model, device, image_bytes, tolerance=0.02, runs=5):
+    """Выбирает самый быстрый режим, у которого совпадение с FP32 не ниже 1 - tolerance."""
+    report = compare_precisions(processor, model, device, image_bytes, runs=runs)
+    accepted = [row for row in report if "error" not in row and row["agreement"] >= 1 - tolerance]
+    if not accepted:
+        return "fp32", report
+    return min(accepted, key=lambda row: row["p50_ms"])["precision"], report
+
+def compare_engines(processor, model, device, image_bytes, engines=None, runs=5, threshold=0.5):
+    """Замеряет скорость движков исполнения и совпадение их детекций с eager."""
+    from Engine import ENGINES, create_engine, warm_up
+
+    prepared = [prepare_image(data, default_resolution()) for data in image_bytes]
+    images, sizes = [p.image for p in prepared], [p.size for p in prepared]
+    engines = ["eager"] + [name for name in (engines or ENGINES) if name != "eager"]
+
+    report, reference = [], None
+    # ONNX экспортируется во временный каталог: файл сервера (Config.ONNX_PATH) не трогается
+    workdir = tempfile.mkdtemp(prefix="detect-bench-")
+    for name in engines:
+        try:
+            start = time.perf_counter()
+            engine = create_engine(name, model, processor, device, onnx_path=os.path.join(workdir, "model.onnx"))
+            warm_up(engine, processor, device, batch_sizes=(len(images),))
+            startup_ms = round((time.perf_counter() - start) * 1000, 2)
+            run = lambda: detect_objects_batch(images, processor, engine, device, target_sizes=sizes, threshold=threshold)
+            results = run()
+            stats = measure(run, runs=runs, warmup=1)
+        except (ImportError, RuntimeError, NotImplementedError) as e:
+            report.append({"engine": name, "error": str(e)})
+            continue
+        if reference is None:
+            reference = results
+        report.append({"engine": name, "startup_ms": startup_ms, "agreement": detection_agreement(reference, results), **stats})
+        print(f"{name}: {report[-1]}")
+    shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+# Разрешения синтетических изображений для замера стадий по умолчанию
+STAGE_RESOLUTIONS = ((640, 480), (1280, 960), (1920, 1080), (4032, 3024))
+
+def reset_peak_rss():
+    """Сбрасывает пиковый RSS процесса (Linux: /proc/self/clear_refs); False, если это невозможно."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def peak_rss_mb():
+    """Пиковый RSS процесса в МБ: с последнего reset_peak_rss (VmHWM), а без /proc — с момента запуска."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+def benchmark_stages(processor, model, device, image_bytes, batch_size, runs=5, threshold=0.9):
+    """Замеряет каждую стадию обработки пакета изображений отдельно и весь конвейер целиком."""
+    batch = (image_bytes * batch_size)[:batch_size]
+    policy = default_resolution()
+    # Пик памяти сбрасывается перед каждым замером, иначе он показывает максимум всех предыдущих строк
+    rss_scope = "run" if reset_peak_rss() else "process"
+    if device.type == "cuda":
+        torch.cuda.reset_peak_memory_stats(device)
+    sync = torch.cuda.synchronize if device.type == "cuda" else (lambda: None)
+
+    def decode():
+        return [Image.open(io.BytesIO(data)).convert("RGB") for data in batch]
+
+    def prepare():
+        return [prepare_image(data, policy) for data in batch]
+
+    def inputs_for(prepared):
+        inputs = processor(images=[p.image for p in prepared], do_resize=False, return_tensors="pt")
+        inputs = {k: v.to(device) for k, v in inputs.items()}
+        inputs["pixel_values"] = inputs["pixel_values"].to(model_dtype(model))
+        return inputs
+
+    def forward(inputs):
+        with torch.inference_mode():
+            outputs = model(**inputs)
+        outputs.logits, outputs.pred_boxes = outputs.logits.float(), outputs.pred_boxes.float()
+        sync()
+        return outputs
+
+    def postprocess(outputs, prepared):
+        target_sizes = torch.tensor([p.size[::-1] for p in prepared], dtype=torch.float32, device=device)
+        return processor.post_process_object_detection(outputs, target_sizes=target_sizes, threshold=threshold)
+
+    def draw(images, results):
+        return [draw_boxes(image.copy(), result, model) for image, result in zip(images, results)]
+
+    def save(images):
+        for image in images:
+            image.save(io.BytesIO(), "JPEG", quality=Config.IMAGE_QUALITY)
+
+    def columns_of(results):
+        return [columns_from_results(result, label_map) for result in results]
+
+    def render(prepared, columns):
+        # Как на сервере: рамки рисуются на уменьшенной копии входа модели готовыми спрайтами подписей
+        return [render_detections(p.image, c, p.size, max_side=Config.RENDER_MAX_SIDE) for p, c in zip(prepared, columns)]
+
+    def encode(images):
+        return [encode_image(image, Config.IMAGE_FORMAT, Config.IMAGE_QUALITY, Config.IMAGE_PROGRESSIVE) for image in images]
+
+    def pipeline():
+        fresh = prepare()
+        encode(render(fresh, columns_of(postprocess(forward(inputs_for(fresh)), fresh))))
+
+    # Входы каждой стадии готовятся заранее, чтобы замер включал только саму стадию
+    label_map = LabelMap(model.config.id2label)
+    images, prepared = decode(), prepare()
+    inputs = inputs_for(prepared)
+    outputs = forward(inputs)
+    results = postprocess(outputs, prepared)
+    columns = columns_of(results)
+    rendered = render(prepared, columns)
+    annotated = draw(images, results)
+
+    # Стадии сервера и конвейер целиком (тот же путь, что у запроса с show_image)
+    stages = {
+        "prepare": prepare,
+        "processor": lambda: inputs_for(prepared),
+        "forward": lambda: forward(inputs),
+        "postprocess": lambda: postprocess(outputs, prepared),
+        "columns": lambda: columns_of(results),
+        "render": lambda: render(prepared, columns),
+        "encode": lambda: encode(rendered),
+        "pipeline": pipeline,
+    }
+    # Прежний путь (полное декодирование, resize_image, draw_boxes, JPEG без настроек сервера):
+    # сервер его не использует, замеры остаются только для сравнения
+    stages.update({
+        "baseline_decode": decode,
+        "baseline_resize_image": lambda: [resize_image(image, 2) for image in images],
+        "baseline_draw_boxes": lambda: draw(images, results),
+        "baseline_jpeg_save": lambda: save(annotated),
+    })
+    report = {"detections": sum(len(result["boxes"]) for result in results)}
+    for name, fn in stages.items():
+        stats = measure(fn, runs=runs, warmup=1)
+        stats["images_per_s"] = round(batch_size * 1000 / stats["mean_ms"], 2) if stats["mean_ms"] else None
+        report[name] = stats
+    report["peak_rss_mb"] = peak_rss_mb()
+    report["peak_rss_scope"] = rss_scope
+    if device.type == "cuda":
+        report["peak_cuda_mb"] = round(torch.cuda.max_memory_allocated(device) / 1024 ** 2, 1)
+    return report
+
+def environment(device, precision):
+    """Сведения об окружении замера для сравнения отчётов между выпусками."""
+    return {
+        "device": torch.cuda.get_device_name(device) if device.type == "cuda" else platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "torch_threads": torch.get_num_threads(),
+        "torch": torch.__version__,
+        "python": platform.python_version(),
+        "precision": precision,
+        "resolution": default_resolution()._asdict(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+def write_report(report, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Report written to {path}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры производительности детектора")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    precision = commands.add_parser("precision", help="сравнить режимы точности и выбрать самый быстрый")
+    precision.add_argument("--images", nargs="*", default=[], help="файлы или каталоги с примерами изображений")
+    precision.add_argument("--tolerance", type=float, default=0.02, help="допустимая доля расхождений с FP32")
+    precision.add_argument("--runs", type=int, default=5)
+    precision.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    precision.add_argument("--output", help="записать отчёт в JSON")
+
+    engine = commands.add_parser("engine", help="сравнить движки исполнения модели")
+    engine.add_argument("--images", nargs="*", default=[], help="файлы или каталоги с примерами изображений")
+    engine.add_argument("--engines", nargs="*", help="какие движки сравнивать (по умолчанию все)")
+    engine.add_argument("--precision", default="fp32", help="режим точности модели")
+    engine.add_argument("--runs", type=int, default=5)
+    engine.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    engine.add_argument("--output", help="записать отчёт в JSON")
+
+    stages = commands.add_parser("stages", help="замерить каждую стадию обработки по размерам пакета и разрешениям")
+    stages.add_argument("--images", nargs="*", default=[], help="файлы или каталоги с примерами изображений (замеряются отдельно)")
+    stages.add_argument("--resolutions", nargs="*", default=[f"{w}x{h}" for w, h in STAGE_RESOLUTIONS],
+                        help="разрешения изображений из примера с объектами, например 1920x1080")
+    stages.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 4, 8])
+    stages.add_argument("--precision", help="режим точности модели (по умолчанию — для устройства)")
+    stages.add_argument("--runs", type=int, default=5)
+    stages.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    stages.add_argument("--output", help="записать отчёт в JSON")
+
+    args = parser.parse_args()
+    device = torch.device(args.device)
+    processor, model = load_model(Config.MODEL_PATH, precision=None)
+
+    if args.command == "precision":
+        image_bytes = load_image_bytes(args.images) or [default_image_bytes()]
+        best, report = select_precision(processor, model, device, image_bytes, args.tolerance, args.runs)
+        print(f"Selected precision: {best}")
+        if args.output:
+            write_report({"device": str(device), "selected": best, "results": report}, args.output)
+    elif args.command == "engine":
+        image_bytes = load_image_bytes(args.images) or [default_image_bytes()]
+        check_precision(args.precision, device)
+        model = apply_precision(model, args.precision).to(device)
+        report = compare_engines(processor, model, device, image_bytes, args.engines, args.runs)
+        if args.output:
+            write_report({"device": str(device), "precision": args.precision, "results": report}, args.output)
+    elif args.command == "stages":
+        precision = args.precision or default_precision(device)
+        check_precision(precision, device)
+        model = apply_precision(model, precision).to(device)
+        image_sets = []
+        for resolution in args.resolutions:
+            size = tuple(map(int, resolution.split("x")))
+            data = sample_image_bytes(*size)
+            # В отчёте отмечено, что изображение — шум: детекций на нём нет, и стадии после модели не нагружены
+            image_sets.append((resolution, "sample" if data else "noise", [data or synthetic_image_bytes(*size)]))
+        if args.images:
+            image_sets.append(("samples", "images", load_image_bytes(args.images)))
+        report = []
+        for name, content, image_bytes in image_sets:
+            for batch_size in args.batch_sizes:
+                row = {"images": name, "content": content, "batch_size": batch_size,
+                       **benchmark_stages(processor, model, device, image_bytes, batch_size, args.runs)}
+                print(f"{name} x{batch_size}: pipeline {row['pipeline']['p50_ms']} ms, "
+                      f"{row['pipeline']['images_per_s']} images/s, {row['detections']} detections, peak RSS {row['peak_rss_mb']} MB")
+                report.append(row)
+        if args.output:
+            write_report({"environment": environment(device, precision), "results": report}, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import os
+
+def env_int(name, default):
+    """Читает целое число из переменной окружения."""
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+def env_float(name, default):
+    """Читает дробное число из переменной окружения."""
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else default
+
+def env_str(name, default):
+    """Читает строку из переменной окружения."""
+    value = os.environ.get(name)
+    return value if value not in (None, "") else default
+
+# Путь к весам модели (FP16)
+MODEL_PATH = env_str("DETECT_MODEL_PATH", "detr_resnet50_fp16.pth")
+
+# Режим точности модели: auto (FP16 на GPU, FP32 на CPU), fp32, bf16, fp16, int8
+# или benchmark — выбрать самый быстрый режим замером при запуске
+PRECISION = env_str("DETECT_PRECISION", "auto")
+# Каталог с примерами изображений для замера точности (пусто — синтетическое изображение)
+BENCHMARK_IMAGES = env_str("DETECT_BENCHMARK_IMAGES", "")
+# Модель с INT8-квантизацией для CPU, собранная Quantize.py (если задана, DETECT_PRECISION не используется)
+QUANTIZED_MODEL = env_str("DETECT_QUANTIZED_MODEL", "")
+
+# Способ исполнения модели: eager, torchscript, compile (torch.compile) или onnx (ONNX Runtime на CPU)
+ENGINE = env_str("DETECT_ENGINE", "eager")
+# Куда сохранять экспортированную ONNX-модель (экспорт выполняется, если файла нет или веса модели сменились)
+ONNX_PATH = env_str("DETECT_ONNX_PATH", "models/detr-resnet50.onnx")
+
+# Разрешение входа модели: уровень fast, balanced или accurate (короткая и длинная сторона),
+# а также переопределение короткой стороны и бюджет пикселей (0 — как у уровня)
+RESOLUTION_TIER = env_str("DETECT_RESOLUTION_TIER", "accurate")
+RESOLUTION_SHORTEST_EDGE = env_int("DETECT_RESOLUTION_SHORTEST_EDGE", 0)
+RESOLUTION_MAX_PIXELS = env_int("DETECT_RESOLUTION_MAX_PIXELS", 0)
+
+# Пакетная обработка: максимальный размер пакета и окно ожидания (в секундах)
+BATCH_MAX_SIZE = env_int("DETECT_BATCH_MAX_SIZE", 8)
+BATCH_MAX_WAIT = env_float("DETECT_BATCH_MAX_WAIT_MS", 10) / 1000
+
+# Пул обработчиков: число потоков, длина очереди и пауза для клиента при перегрузке
+WORKER_THREADS = env_int("DETECT_WORKER_THREADS", 8)
+TASK_QUEUE_SIZE = env_int("DETECT_TASK_QUEUE_SIZE", 32)
+RETRY_AFTER = env_int("DETECT_RETRY_AFTER", 5)
+MAX_UPLOAD_MB = env_int("DETECT_MAX_UPLOAD_MB", 20)
+
+# Синхронный API: время ожидания результата по умолчанию и верхняя граница (секунды)
+API_TIMEOUT = env_float("DETECT_API_TIMEOUT", 30)
+API_MAX_TIMEOUT = env_float("DETECT_API_MAX_TIMEOUT", 120)
+
+# Пакетный API: максимальное число изображений в одном запросе
+BATCH_MAX_IMAGES = env_int("DETECT_BATCH_MAX_IMAGES", 256)
+# Сколько изображений пакета одновременно скачивается, декодировано или ждёт детекции (ограничивает память)
+BATCH_MAX_IN_FLIGHT = env_int("DETECT_BATCH_MAX_IN_FLIGHT", BATCH_MAX_SIZE * 2)
+
+# Хранилище результатов: memory://, sqlite:///path/to/results.db или redis://host:port/0
+RESULT_STORE = env_str("DETECT_RESULT_STORE", "memory://")
+# Время жизни (секунды), максимальное число записей и объём
+RESULT_TTL = env_int("DETECT_RESULT_TTL", 3600)
+RESULT_MAX_ITEMS = env_int("DETECT_RESULT_MAX_ITEMS", 10000)
+RESULT_MAX_MB = env_int("DETECT_RESULT_MAX_MB", 64)
+
+# Ожидание результата через /task_events и long-poll: максимум ожидания и интервал keepalive (секунды)
+EVENT_TIMEOUT = env_float("DETECT_EVENT_TIMEOUT", 180)
+EVENT_KEEPALIVE = env_float("DETECT_EVENT_KEEPALIVE", 15)
+
+# Кэш результатов по хэшу изображения: размер в памяти и каталог для уровня на диске (пусто — выключен)
+CACHE_MAX_ITEMS = env_int("DETECT_CACHE_MAX_ITEMS", 1024)
+CACHE_DIR = env_str("DETECT_CACHE_DIR", "")
+
+# Загрузка по URL: число потоков, длина очереди, параллельных загрузок на хост и таймауты (секунды)
+FETCH_WORKERS = env_int("DETECT_FETCH_WORKERS", 16)
+FETCH_QUEUE_SIZE = env_int("DETECT_FETCH_QUEUE_SIZE", 128)
+FETCH_PER_HOST = env_int("DETECT_FETCH_PER_HOST", 4)
+FETCH_CONNECT_TIMEOUT = env_float("DETECT_FETCH_CONNECT_TIMEOUT", 5)
+FETCH_READ_TIMEOUT = env_float("DETECT_FETCH_READ_TIMEOUT", 15)
+
+# Отрисовка рамок: максимальная длинная сторона аннотированного изображения (0 — без уменьшения)
+RENDER_MAX_SIDE = env_int("DETECT_RENDER_MAX_SIDE", 1024)
+
+# Кодирование аннотированных изображений: число потоков, формат (jpeg, webp, png), качество и прогрессивный JPEG
+ENCODER_THREADS = env_int("DETECT_ENCODER_THREADS", 2)
+IMAGE_FORMAT = env_str("DETECT_IMAGE_FORMAT", "jpeg")
+IMAGE_QUALITY = env_int("DETECT_IMAGE_QUALITY", 85)
+IMAGE_PROGRESSIVE = env_int("DETECT_IMAGE_PROGRESSIVE", 1) == 1
+
+# Видео и последовательности кадров: сколько кадров в секунду обрабатывать (0 — все),
+# частота кадров для последовательностей изображений, кадров в работе одновременно
+# и каталог локального архива, из которого /api/v1/detect_video читает файлы по пути (пусто — только загрузка)
+VIDEO_SAMPLE_FPS = env_float("DETECT_VIDEO_SAMPLE_FPS", 2)
+VIDEO_FRAME_RATE = env_float("DETECT_VIDEO_FRAME_RATE", 25)
+VIDEO_MAX_IN_FLIGHT = env_int("DETECT_VIDEO_MAX_IN_FLIGHT", BATCH_MAX_SIZE * 2)
+VIDEO_DIR = env_str("DETECT_VIDEO_DIR", "")
+
+# Повтор детекций на почти одинаковых кадрах: минимальное изменение кадра (0–1) для нового
+# прогона модели (0 — каждый кадр через модель) и сколько кадров подряд можно повторить
+VIDEO_CHANGE_THRESHOLD = env_float("DETECT_VIDEO_CHANGE_THRESHOLD", 0.02)
+VIDEO_MAX_REUSE = env_int("DETECT_VIDEO_MAX_REUSE", 10)
+# Трекер объектов: минимальный IoU для продолжения трека и сколько кадров трек живёт без совпадений
+TRACK_IOU = env_float("DETECT_TRACK_IOU", 0.3)
+TRACK_MAX_AGE = env_int("DETECT_TRACK_MAX_AGE", 5)
+
+# Режим плиток для очень больших изображений: сторона плитки (пиксели исходного изображения;
+# по умолчанию — короткая сторона политики разрешения, чтобы плитки не уменьшались), доля перекрытия, объединение рамок на стыках (nms или wbf) и IoU, при котором рамки — один объект
+TILE_SIZE = env_int("DETECT_TILE_SIZE", None)
+TILE_OVERLAP = env_float("DETECT_TILE_OVERLAP", 0.2)
+TILE_MERGE = env_str("DETECT_TILE_MERGE", "nms")
+TILE_IOU = env_float("DETECT_TILE_IOU", 0.5)
@@ -1,12 +1,12 @@
 from transformers import DetrImageProcessor, DetrForObjectDetection
 import torch
-from PIL import Image, ImageDraw, ImageFont
-import requests
+from PIL import Image, ImageDraw
 import os
+from Render import load_font
+from Precision import apply_precision, model_dtype
 
-def load_image_from_url(url):
-    """Загружает изображение по URL."""
-    return Image.open(requests.get(url, stream=True).raw)
+# Порог уверенности для отбора детекций
+DEFAULT_THRESHOLD = 0.9
 
 def load_image_from_path(path):
     """Загружает изображение по пути."""
@@ -17,34 +17,85 @@ def resize_image(image, scale_factor):
     new_size = (image.width // scale_factor, image.height // scale_factor)
     return image.resize(new_size)
 
-def load_model(model_path=None):
-    """Загружает предобученную модель и процессор."""
-    processor = DetrImageProcessor.from_pretrained("facebook/detr-resnet-50")
-    model = DetrForObjectDetection.from_pretrained("facebook/detr-resnet-50")
-    
-    if model_path and os.path.exists(model_path):
-        model.load_state_dict(torch.load(model_path))
-    model.half()
-    
+# Файл весов внутри артефакта, собранного PackModel.py
+ARTIFACT_WEIGHTS = "model.safetensors"
+
+def load_model(model_path=None, precision=None):
+    """Загружает предобученную модель и процессор (model_path может быть артефактом PackModel.py).
+
+    precision — режим из Precision.PRECISIONS (обычно Precision.default_precision(device));
+    None оставляет тип весов как при загрузке.
+    """
+    if model_path and os.path.isdir(model_path):
+        processor, model = load_model_artifact(model_path, ARTIFACT_DTYPES.get(precision, "auto"))
+    else:
+        processor = DetrImageProcessor.from_pretrained("facebook/detr-resnet-50")
+        model = DetrForObjectDetection.from_pretrained("facebook/detr-resnet-50")
+
+        if model_path and os.path.exists(model_path):
+            model.load_state_dict(torch.load(model_path))
+
+    if precision is not None:
+        model = apply_precision(model, precision)
     return processor, model
 
+# Тип весов, в котором артефакт загружается сразу под режим точности (остальные режимы — в типе артефакта)
+ARTIFACT_DTYPES = {"fp32": torch.float32, "bf16": torch.bfloat16, "fp16": torch.float16}
+
+def load_model_artifact(path, dtype="auto"):
+    """Загружает модель и процессор из локального артефакта без обращения к сети.
+
+    Веса читаются из safetensors без pickle; с dtype="auto" — в том типе, в котором они
+    сохранены, иначе приводятся к dtype один раз при загрузке.
+    """
+    processor = DetrImageProcessor.from_pretrained(path, local_files_only=True)
+    model = DetrForObjectDetection.from_pretrained(path, local_files_only=True, use_safetensors=True, torch_dtype=dtype)
+    return processor, model
+
+def checkpoint_id(model_path=None):
+    """Идентификатор весов модели для ключей кэша: путь, размер и время изменения файла."""
+    if model_path and os.path.isdir(model_path):
+        model_path = os.path.join(model_path, ARTIFACT_WEIGHTS)
+    if model_path and os.path.exists(model_path):
+        stat = os.stat(model_path)
+        return f"{os.path.abspath(model_path)}:{stat.st_size}:{int(stat.st_mtime)}"
+    return "facebook/detr-resnet-50"
+
 def detect_objects(image, processor, model, device):
     """Обнаруживает объекты на изображении и возвращает результаты."""
-    inputs = processor(images=image, return_tensors="pt").to(device)
-    inputs = {k: v.half() for k, v in inputs.items()}  # Convert inputs to FP16
-    outputs = model(**inputs)
-    target_sizes = torch.tensor([image.size[::-1]]).to(device).half()  # Convert target_sizes to FP16
-    results = processor.post_process_object_detection(outputs, target_sizes=target_sizes, threshold=0.9)[0]
-    return results
+    return detect_objects_batch([image], processor, model, device)[0]
+
+def detect_objects_batch(images, processor, model, device, target_sizes=None, threshold=DEFAULT_THRESHOLD):
+    """Обнаруживает объекты на пакете изображений за один прогон модели.
+
+    Если заданы target_sizes (ширина, высота), изображения считаются уже приведёнными
+    к размеру входа модели, а рамки возвращаются в координатах target_sizes.
+    """
+    # Процессор дополняет изображения до общего размера и возвращает pixel_mask
+    if target_sizes is None:
+        inputs = processor(images=images, return_tensors="pt")
+        target_sizes = [image.size for image in images]
+    else:
+        inputs = processor(images=images, do_resize=False, return_tensors="pt")
+    inputs = {k: v.to(device) for k, v in inputs.items()}
+    inputs["pixel_values"] = inputs["pixel_values"].to(model_dtype(model))  # Вход в том же типе, что и веса модели
+    # Без графа автоградиента: при инференсе он только тратит память и время
+    with torch.inference_mode():
+        outputs = model(**inputs)
+    # Постпроцессинг в FP32: в половинной точности координаты рамок теряют точность
+    outputs.logits = outputs.logits.float()
+    outputs.pred_boxes = outputs.pred_boxes.float()
+    target_sizes = torch.tensor([size[::-1] for size in target_sizes], dtype=torch.float32, device=device)
+    return processor.post_process_object_detection(outputs, target_sizes=target_sizes, threshold=threshold)
 
 def draw_boxes(image, results, model):
     """Рисует прямоугольники вокруг обнаруженных объектов на изображении."""
     draw = ImageDraw.Draw(image)
+    font = load_font(24)
     for score, label, box in zip(results["scores"], results["labels"], results["boxes"]):
         box = [round(i, 2) for i in box.tolist()]
         draw.rectangle(box, outline="red", width=2)  # Рисуем прямоугольник
-        font_size = 24
         text_x = round(box[0]) + 5
         text_y = round(box[3])
-        draw.text((text_x, text_y), f"{model.config.id2label[label.item()]}: {round(score.item(), 2)}", fill="red", font=ImageFont.truetype("arial.ttf", font_size))  # Добавляем текст
-    return image
\ No newline at end of file
+        draw.text((text_x, text_y), f"{model.config.id2label[label.item()]}: {round(score.item(), 2)}", fill="red", font=font)  # Добавляем текст
+    return image
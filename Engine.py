@@ -0,0 +1,158 @@
+import copy
+import os
+
+import torch
+from PIL import Image
+from torch import nn
+from transformers.models.detr.modeling_detr import DetrObjectDetectionOutput
+
+from Detect import checkpoint_id, detect_objects_batch
+from Precision import model_dtype
+from Preprocess import default_resolution, input_size, model_input_size
+
+# Поддерживаемые способы исполнения модели
+ENGINES = ("eager", "torchscript", "compile", "onnx")
+
+class DetrHead(nn.Module):
+    """Обёртка модели с тензорными входами и выходами: её можно трассировать и экспортировать."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values, pixel_mask):
+        outputs = self.model(pixel_values=pixel_values, pixel_mask=pixel_mask)
+        return outputs.logits, outputs.pred_boxes
+
+class EagerEngine:
+    """Обычный прогон модели PyTorch; остальные движки подменяют forward."""
+
+    name = "eager"
+    # Файл, из которого исполняется модель, если он отличается от весов (входит в ключ кэша результатов)
+    artifact = None
+
+    def __init__(self, model):
+        self.model = model
+        self.config = model.config
+        self.input_dtype = model_dtype(model)
+
+    def forward(self, pixel_values, pixel_mask):
+        return self.model(pixel_values=pixel_values, pixel_mask=pixel_mask)
+
+    def __call__(self, pixel_values, pixel_mask, **kwargs):
+        return self.forward(pixel_values, pixel_mask)
+
+class TorchScriptEngine(EagerEngine):
+    """Модель, оттрассированная в TorchScript и замороженная (константы весов встраиваются в граф)."""
+
+    name = "torchscript"
+
+    def __init__(self, model, example):
+        super().__init__(model)
+        with torch.inference_mode():
+            traced = torch.jit.trace(DetrHead(model).eval(), example, check_trace=False)
+        self.graph = torch.jit.freeze(traced)
+
+    def forward(self, pixel_values, pixel_mask):
+        logits, pred_boxes = self.graph(pixel_values, pixel_mask)
+        return DetrObjectDetectionOutput(logits=logits, pred_boxes=pred_boxes)
+
+class CompiledEngine(EagerEngine):
+    """Модель, скомпилированная torch.compile; граф строится при первом прогоне (прогреве)."""
+
+    name = "compile"
+
+    def __init__(self, model):
+        super().__init__(model)
+        self.graph = torch.compile(DetrHead(model).eval(), dynamic=True)
+
+    def forward(self, pixel_values, pixel_mask):
+        logits, pred_boxes = self.graph(pixel_values, pixel_mask)
+        return DetrObjectDetectionOutput(logits=logits, pred_boxes=pred_boxes)
+
+class OnnxEngine(EagerEngine):
+    """Модель, экспортированная в ONNX и исполняемая ONNX Runtime на CPU."""
+
+    name = "onnx"
+
+    def __init__(self, model, example, path, source=""):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise RuntimeError("ONNX engine requires onnxruntime: pip install onnxruntime")
+        super().__init__(model)
+        # ONNX Runtime на CPU исполняет граф в FP32
+        self.input_dtype = torch.float32
+        # Рядом с файлом хранится идентификатор весов, из которых он экспортирован:
+        # если веса сменились, устаревший граф экспортируется заново
+        stamp = path + ".source"
+        if not os.path.exists(path) or read_text(stamp) != source:
+            export_onnx(model, example, path)
+            with open(stamp, "w", encoding="utf-8") as f:
+                f.write(source)
+        self.artifact = checkpoint_id(path)
+        self.session = onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+
+    def forward(self, pixel_values, pixel_mask):
+        logits, pred_boxes = self.session.run(["logits", "pred_boxes"], {
+            "pixel_values": pixel_values.float().cpu().numpy(),
+            "pixel_mask": pixel_mask.to(torch.int64).cpu().numpy(),
+        })
+        device = pixel_values.device
+        return DetrObjectDetectionOutput(logits=torch.from_numpy(logits).to(device), pred_boxes=torch.from_numpy(pred_boxes).to(device))
+
+def read_text(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return None
+
+def export_onnx(model, example, path):
+    """Экспортирует модель в ONNX с переменным размером пакета и изображения."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    head = DetrHead(copy.deepcopy(model).float().cpu()).eval()
+    dynamic_axes = {
+        "pixel_values": {0: "batch", 2: "height", 3: "width"},
+        "pixel_mask": {0: "batch", 1: "height", 2: "width"},
+        "logits": {0: "batch"},
+        "pred_boxes": {0: "batch"},
+    }
+    with torch.inference_mode():
+        torch.onnx.export(head, tuple(t.float().cpu() if t.is_floating_point() else t.cpu() for t in example), path,
+                          input_names=["pixel_values", "pixel_mask"], output_names=["logits", "pred_boxes"],
+                          dynamic_axes=dynamic_axes, opset_version=17)
+
+def example_inputs(processor, device, dtype=torch.float32, size=(1066, 800)):
+    """Пример входа модели (pixel_values, pixel_mask) размера size для трассировки и экспорта."""
+    image = Image.new("RGB", model_input_size(size, processor.size))
+    inputs = processor(images=[image], do_resize=False, return_tensors="pt")
+    return inputs["pixel_values"].to(device, dtype), inputs["pixel_mask"].to(device)
+
+def create_engine(name, model, processor, device, onnx_path="models/detr-resnet50.onnx", source=""):
+    """Оборачивает модель в движок исполнения с заданным именем.
+
+    source — идентификатор весов модели (checkpoint_id и точность); по нему ONNX-файл
+    проверяется на соответствие загруженной модели.
+    """
+    if name == "eager":
+        return EagerEngine(model)
+    if name == "torchscript":
+        return TorchScriptEngine(model, example_inputs(processor, device, model_dtype(model)))
+    if name == "compile":
+        return CompiledEngine(model)
+    if name == "onnx":
+        return OnnxEngine(model, example_inputs(processor, torch.device("cpu")), onnx_path, source)
+    raise ValueError(f"Unknown engine: {name} (expected one of {', '.join(ENGINES)})")
+
+# Типичные пропорции входов для прогрева: альбомная, портретная и квадратная
+WARMUP_SIZES = ((1333, 1000), (1000, 1333), (1000, 1000))
+
+def warm_up(engine, processor, device, batch_sizes=(1,), sizes=WARMUP_SIZES, policy=None):
+    """Прогоняет движок на входах типичной формы, чтобы компиляция и выделение памяти прошли до первых запросов."""
+    policy = policy or default_resolution()
+    for size in sizes:
+        target = input_size(size, policy)
+        for batch_size in batch_sizes:
+            images = [Image.new("RGB", target)] * batch_size
+            detect_objects_batch(images, processor, engine, device, target_sizes=[size] * batch_size)
@@ -0,0 +1,144 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from WorkerPool import WorkerPool, QueueFullError
+
+class FetchError(Exception):
+    """Изображение по URL не удалось загрузить."""
+
+class UrlFetcher:
+    """Отдельная стадия загрузки изображений по URL: пул соединений, таймауты и лимиты."""
+
+    def __init__(self, workers=16, queue_size=128, per_host=4, connect_timeout=5, read_timeout=15, max_bytes=20 * 1024 * 1024):
+        self.per_host = per_host
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_bytes = max_bytes
+        # Keep-alive соединения переиспользуются между запросами к одному хосту
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.pool = WorkerPool(workers=workers, queue_size=queue_size, name="fetch")
+        self.queue_size = queue_size
+        # Лимит на хост соблюдается до пула: загрузки сверх лимита ждут в очереди своего хоста,
+        # а не в рабочих потоках, поэтому медленный хост не занимает потоки других запросов
+        self._active = {}  # хост -> число загрузок в пуле
+        self._waiting = {}  # хост -> deque((Future, url)) сверх лимита
+        self._waiting_count = 0
+        self._hosts_lock = threading.Lock()
+
+    def start(self):
+        """Запускает потоки загрузки."""
+        self.pool.start()
+
+    def submit(self, url):
+        """Ставит загрузку в очередь и возвращает Future с байтами изображения.
+
+        При переполнении очереди бросает QueueFullError. Если у хоста уже per_host загрузок,
+        новая ждёт в очереди хоста и уходит в пул, когда одна из них завершится.
+        """
+        host = urlsplit(url).hostname
+        if not host:
+            # Неподдерживаемый URL: fetch сразу вернёт ошибку
+            return self.pool.submit(self.fetch, url)
+        future = Future()
+        with self._hosts_lock:
+            if self._active.get(host, 0) >= self.per_host:
+                if self._waiting_count >= self.queue_size:
+                    raise QueueFullError(f"{self.pool.name} queue is full ({self.queue_size} tasks)")
+                self._waiting.setdefault(host, deque()).append((future, url))
+                self._waiting_count += 1
+                return future
+            self._active[host] = self._active.get(host, 0) + 1
+        try:
+            self._dispatch(host, future, url)
+        except QueueFullError:
+            self._release(host)
+            raise
+        return future
+
+    def _dispatch(self, host, future, url):
+        inner = self.pool.submit(self.fetch, url)
+
+        def done(inner):
+            try:
+                future.set_result(inner.result())
+            except Exception as e:
+                future.set_exception(e)
+            self._release(host)
+
+        inner.add_done_callback(done)
+
+    def _release(self, host):
+        """Освобождает место хоста: его занимает следующая ждущая загрузка этого хоста."""
+        while True:
+            with self._hosts_lock:
+                waiting = self._waiting.get(host)
+                if not waiting:
+                    self._waiting.pop(host, None)
+                    self._active[host] -= 1
+                    if not self._active[host]:
+                        del self._active[host]
+                    return
+                future, url = waiting.popleft()
+                self._waiting_count -= 1
+            try:
+                self._dispatch(host, future, url)
+                return
+            except QueueFullError as e:
+                future.set_exception(FetchError(str(e)))
+
+    def fetch(self, url):
+        """Скачивает изображение с ограничением по времени и размеру."""
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise FetchError(f"Unsupported URL: {url}")
+
+        # read_timeout ограничивает и паузу между пакетами, и загрузку целиком
+        deadline = time.monotonic() + self.timeout[1]
+        with self.session.get(url, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            length = response.headers.get("Content-Length")
+            if length and length.isdigit() and int(length) > self.max_bytes:
+                raise FetchError(f"Image is too large ({length} bytes, max {self.max_bytes})")
+            chunks = []
+            size = 0
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                size += len(chunk)
+                if size > self.max_bytes:
+                    raise FetchError(f"Image is too large (max {self.max_bytes} bytes)")
+                if time.monotonic() > deadline:
+                    raise FetchError(f"Download timed out after {self.timeout[1]} s")
+                chunks.append(chunk)
+        return b"".join(chunks)
+
+def then(future, fn):
+    """Когда future завершится, вызывает fn(future) и передаёт результат возвращённого им Future."""
+    chained = Future()
+
+    def forward(inner):
+        try:
+            chained.set_result(inner.result())
+        except Exception as e:
+            chained.set_exception(e)
+
+    def advance(done):
+        try:
+            fn(done).add_done_callback(forward)
+        except Exception as e:
+            chained.set_exception(e)
+
+    future.add_done_callback(advance)
+    return chained
+
+def completed(result):
+    """Future с готовым результатом."""
+    future = Future()
+    future.set_result(result)
+    return future
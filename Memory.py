@@ -0,0 +1,30 @@
+import os
+
+def memory_usage(pid="self"):
+    """Память процесса в МБ из /proc/<pid>/smaps_rollup: rss, pss, уникальная (uss) и общая (shared).
+
+    uss — страницы, принадлежащие только этому процессу; веса модели, разделённые
+    с мастером после fork, попадают в shared. Вне Linux возвращает пустой словарь.
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1])
+    except OSError:
+        return {}
+    mb = lambda kb: round(kb / 1024, 1)
+    return {
+        "rss_mb": mb(fields.get("Rss", 0)),
+        "pss_mb": mb(fields.get("Pss", 0)),
+        "uss_mb": mb(fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)),
+        "shared_mb": mb(fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)),
+    }
+
+def format_memory(usage):
+    return ", ".join(f"{key[:-3].upper()} {value} MB" for key, value in usage.items()) or "unavailable"
+
+if __name__ == "__main__":
+    print(f"Process {os.getpid()}: {format_memory(memory_usage())}")
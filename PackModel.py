@@ -0,0 +1,24 @@
+import argparse
+import os
+
+from Detect import load_model, ARTIFACT_WEIGHTS
+
+def pack_model(weights_path, output_dir):
+    """Собирает локальный артефакт: config.json, preprocessor_config.json и model.safetensors."""
+    # Артефакт хранит веса в исходном типе (без округления до FP16); режим точности выбирается при загрузке
+    processor, model = load_model(weights_path, precision=None)
+    # Веса бэкбона уже входят в артефакт, при загрузке timm не должен скачивать их заново
+    model.config.use_pretrained_backbone = False
+    os.makedirs(output_dir, exist_ok=True)
+    model.save_pretrained(output_dir, safe_serialization=True)
+    processor.save_pretrained(output_dir)
+    return os.path.join(output_dir, ARTIFACT_WEIGHTS)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Упаковка модели в локальный артефакт для быстрого запуска без сети")
+    parser.add_argument("--weights", default="detr_resnet50_fp16.pth", help="файл весов поверх facebook/detr-resnet-50")
+    parser.add_argument("--output", default="models/detr-resnet50", help="каталог артефакта")
+    args = parser.parse_args()
+
+    weights = pack_model(args.weights, args.output)
+    print(f"Model packed to {args.output} ({os.path.getsize(weights) / 1024 / 1024:.1f} MB)")
@@ -0,0 +1,77 @@
+from collections import namedtuple
+
+import numpy as np
+import torch
+
+from Detect import DEFAULT_THRESHOLD
+
+# Параметры отбора детекций для одного запроса; classes — кортеж id классов или None (все классы)
+DetectOptions = namedtuple("DetectOptions", ["threshold", "max_detections", "classes"],
+                           defaults=(DEFAULT_THRESHOLD, None, None))
+
+class LabelMap:
+    """Таблица id → название класса в виде массива NumPy для векторного сопоставления."""
+
+    def __init__(self, id2label):
+        size = max(id2label) + 1 if id2label else 0
+        self.names = np.array([id2label.get(i, f"LABEL_{i}") for i in range(size)], dtype=object)
+
+    def __call__(self, label_ids):
+        return self.names[label_ids]
+
+    def ids(self, names):
+        """Названия классов → отсортированный кортеж id; неизвестное название — ValueError."""
+        lookup = {name: i for i, name in enumerate(self.names)}
+        unknown = [name for name in names if name not in lookup]
+        if unknown:
+            raise ValueError(f"Unknown classes: {', '.join(unknown)}")
+        return tuple(sorted({lookup[name] for name in names}))
+
+def filter_results(results, options):
+    """Отбирает детекции по порогу, классам и количеству прямо на тензорах, до переноса на CPU."""
+    scores, labels, boxes = results["scores"], results["labels"], results["boxes"]
+    keep = scores >= options.threshold
+    if options.classes is not None:
+        keep &= torch.isin(labels, torch.tensor(options.classes, device=labels.device))
+    scores, labels, boxes = scores[keep], labels[keep], boxes[keep]
+    if options.max_detections is not None and scores.numel() > options.max_detections:
+        top = torch.topk(scores.float(), options.max_detections).indices
+        scores, labels, boxes = scores[top], labels[top], boxes[top]
+    return {"scores": scores, "labels": labels, "boxes": boxes}
+
+def columns_from_results(results, label_map):
+    """Переводит результат post_process_object_detection в столбцы: labels, confidence, boxes.
+
+    Каждый тензор переносится на CPU один раз, округление и поиск названий выполняются векторно.
+    """
+    # float64, чтобы округлённые значения сериализовались без хвостов вида 0.9990000128
+    scores = results["scores"].detach().cpu().double().numpy()
+    label_ids = results["labels"].detach().cpu().numpy()
+    boxes = results["boxes"].detach().cpu().double().numpy()
+    return {
+        "labels": label_map(label_ids).tolist(),
+        "confidence": np.round(scores, 3).tolist(),
+        "boxes": np.round(boxes, 2).tolist(),
+    }
+
+def records_from_columns(columns):
+    """Столбцы → список детекций вида {"label", "confidence", "box"} (и "id", если рамки сопровождаются трекером)."""
+    records = [{"label": label, "confidence": confidence, "box": box}
+               for label, confidence, box in zip(columns["labels"], columns["confidence"], columns["boxes"])]
+    if "ids" in columns:
+        for record, track_id in zip(records, columns["ids"]):
+            record["id"] = track_id
+    return records
+
+def box_iou(a, b):
+    """Матрица IoU для рамок [x0, y0, x1, y1]."""
+    a, b = np.asarray(a, dtype=np.float64).reshape(-1, 4), np.asarray(b, dtype=np.float64).reshape(-1, 4)
+    x0 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y0 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x1 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y1 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x1 - x0, 0, None) * np.clip(y1 - y0, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
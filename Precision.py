@@ -0,0 +1,46 @@
+import torch
+from torch import nn
+
+# Поддерживаемые режимы точности модели
+PRECISIONS = ("fp32", "bf16", "fp16", "int8")
+
+def candidate_precisions(device):
+    """Режимы, которые имеет смысл проверять на устройстве."""
+    if device.type == "cuda":
+        return ["fp32", "fp16"] + (["bf16"] if torch.cuda.is_bf16_supported() else [])
+    # FP16-свёртки на CPU медленные или не поддерживаются, динамическая INT8-квантизация — только на CPU
+    return ["fp32", "bf16", "int8"]
+
+def default_precision(device):
+    """Режим по умолчанию без замеров: FP16 на GPU, FP32 на CPU."""
+    return "fp16" if device.type == "cuda" else "fp32"
+
+def check_precision(precision, device):
+    """Проверяет режим точности до загрузки модели: неизвестный или неподдерживаемый устройством — ValueError."""
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision: {precision} (expected one of {', '.join(PRECISIONS)})")
+    if precision == "int8" and device.type != "cpu":
+        raise ValueError(f"Precision int8 (dynamic quantization) runs on CPU only, not on {device.type}; use fp16 or bf16")
+
+def apply_precision(model, precision):
+    """Переводит модель в заданный режим точности и возвращает её."""
+    if precision == "fp32":
+        return model.float()
+    if precision == "bf16":
+        return model.to(torch.bfloat16)
+    if precision == "fp16":
+        return model.half()
+    if precision == "int8":
+        # Динамическая квантизация линейных слоёв трансформера; свёрточный бэкбон остаётся в FP32
+        return torch.ao.quantization.quantize_dynamic(model.float(), {nn.Linear}, dtype=torch.qint8)
+    raise ValueError(f"Unknown precision: {precision} (expected one of {', '.join(PRECISIONS)})")
+
+def model_dtype(model):
+    """Тип данных, в котором модель ожидает pixel_values."""
+    # Движки исполнения из Engine.py сообщают тип входа сами
+    if hasattr(model, "input_dtype"):
+        return model.input_dtype
+    for parameter in model.parameters():
+        if parameter.is_floating_point():
+            return parameter.dtype
+    return torch.float32
@@ -0,0 +1,125 @@
+import io
+import math
+from collections import namedtuple
+
+from PIL import Image
+
+import Config
+
+# image — изображение в размере входа модели, size — (ширина, высота) пространства координат рамок
+PreparedImage = namedtuple("PreparedImage", ["image", "size"])
+
+# Политика разрешения входа: целевая короткая сторона, предел длинной стороны и бюджет пикселей (None — без бюджета)
+ResolutionPolicy = namedtuple("ResolutionPolicy", ["shortest_edge", "longest_edge", "max_pixels"], defaults=(800, 1333, None))
+
+# Уровни задержки: чем меньше вход, тем быстрее прогон и хуже видны мелкие объекты
+RESOLUTION_TIERS = {
+    "fast": ResolutionPolicy(480, 800),
+    "balanced": ResolutionPolicy(640, 1066),
+    "accurate": ResolutionPolicy(800, 1333),
+}
+
+def resolution_policy(tier, shortest_edge=None, max_pixels=None):
+    """Политика уровня tier с переопределёнными короткой стороной и бюджетом пикселей."""
+    if tier not in RESOLUTION_TIERS:
+        raise ValueError(f"Unknown resolution tier: {tier} (expected one of {', '.join(RESOLUTION_TIERS)})")
+    policy = RESOLUTION_TIERS[tier]
+    if shortest_edge:
+        policy = policy._replace(shortest_edge=shortest_edge, longest_edge=max(policy.longest_edge, shortest_edge))
+    if max_pixels:
+        policy = policy._replace(max_pixels=max_pixels)
+    return policy
+
+def default_resolution():
+    """Политика разрешения из настроек сервера."""
+    return resolution_policy(Config.RESOLUTION_TIER, Config.RESOLUTION_SHORTEST_EDGE, Config.RESOLUTION_MAX_PIXELS)
+
+def input_size(size, policy):
+    """Размер входа модели (ширина, высота) по политике: один масштаб для обеих сторон, без увеличения.
+
+    Маленькие изображения идут в модель как есть, большие уменьшаются до короткой стороны,
+    предела длинной стороны или бюджета пикселей — что окажется строже.
+    """
+    width, height = size
+    scale = min(1.0, policy.shortest_edge / min(width, height), policy.longest_edge / max(width, height))
+    if policy.max_pixels:
+        scale = min(scale, math.sqrt(policy.max_pixels / (width * height)))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def model_input_size(size, processor_size):
+    """Размер (ширина, высота), к которому DetrImageProcessor привёл бы изображение."""
+    width, height = size
+    shortest = processor_size.get("shortest_edge", 800)
+    longest = processor_size.get("longest_edge")
+    # Та же арифметика, что и в DetrImageProcessor (get_size_with_aspect_ratio)
+    raw_size = None
+    if longest is not None:
+        min_side, max_side = float(min(width, height)), float(max(width, height))
+        if max_side / min_side * shortest > longest:
+            raw_size = longest * min_side / max_side
+            shortest = int(round(raw_size))
+    if (height <= width and height == shortest) or (width <= height and width == shortest):
+        return width, height
+    if width < height:
+        new_height = int((raw_size if raw_size is not None else shortest) * height / width)
+        return shortest, new_height
+    new_width = int((raw_size if raw_size is not None else shortest) * width / height)
+    return new_width, shortest
+
+def prepare_image(image_bytes, policy):
+    """Декодирует изображение сразу в размер входа модели одним ресемплингом.
+
+    Рамки возвращаются в координатах исходного изображения с учётом EXIF-ориентации,
+    то есть так, как изображение показывает браузер.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    orientation = exif_orientation(image)
+    target = input_size(image.size, policy)
+
+    # Для JPEG декодер сам уменьшает изображение в 2/4/8 раз, не создавая полноразмерный буфер
+    size = image.size
+    if image.format == "JPEG":
+        image.draft("RGB", target)
+    # Поворот применяется к уже уменьшенному изображению: так дешевле, чем поворачивать исходное
+    return PreparedImage(orient(fit_image(image, target), orientation), oriented_size(size, orientation))
+
+def prepare_frame(image, policy):
+    """То же для уже декодированного изображения (например, кадра видео)."""
+    orientation = exif_orientation(image)
+    image_size = image.size
+    image = orient(fit_image(image, input_size(image_size, policy)), orientation)
+    return PreparedImage(image, oriented_size(image_size, orientation))
+
+# Поворот и отражение для значений тега EXIF Orientation (как в ImageOps.exif_transpose)
+EXIF_ORIENTATION = 0x0112
+ORIENTATION_TRANSPOSE = {
+    2: Image.FLIP_LEFT_RIGHT,
+    3: Image.ROTATE_180,
+    4: Image.FLIP_TOP_BOTTOM,
+    5: Image.TRANSPOSE,
+    6: Image.ROTATE_270,
+    7: Image.TRANSVERSE,
+    8: Image.ROTATE_90,
+}
+
+def exif_orientation(image):
+    """Значение тега EXIF Orientation (1 — без поворота), читается без декодирования пикселей."""
+    try:
+        return image.getexif().get(EXIF_ORIENTATION, 1)
+    except Exception:
+        return 1
+
+def orient(image, orientation):
+    method = ORIENTATION_TRANSPOSE.get(orientation)
+    return image.transpose(method) if method is not None else image
+
+def oriented_size(size, orientation):
+    """Размер изображения после поворота по EXIF: при 5–8 ширина и высота меняются местами."""
+    return size[::-1] if orientation in (5, 6, 7, 8) else size
+
+def fit_image(image, target):
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    if image.size != target:
+        image = image.resize(target, Image.BILINEAR)
+    return image
@@ -0,0 +1,114 @@
+import argparse
+import copy
+import os
+import sys
+
+import torch
+
+import Config
+from Benchmark import detection_agreement, load_image_bytes, measure
+from Detect import load_model, detect_objects_batch
+from Precision import apply_precision
+from Preprocess import default_resolution, prepare_image
+
+def backbone_of(model):
+    """Свёрточный бэкбон DETR (ResNet-50), который можно квантизовать статически."""
+    return model.model.backbone.conv_encoder.model
+
+def quantize_backbone_static(model, processor, calibration_images):
+    """Статическая INT8-квантизация бэкбона (FX graph mode) с калибровкой на примерах.
+
+    Возвращает True, если бэкбон заменён квантизованным; если граф бэкбона не удаётся
+    оттрассировать или квантизовать, модель остаётся без изменений.
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    engine = "x86" if "x86" in torch.backends.quantized.supported_engines else "fbgemm"
+    torch.backends.quantized.engine = engine
+    backbone = backbone_of(model)
+    prepared = [prepare_image(data, default_resolution()) for data in calibration_images]
+    example = processor(images=[prepared[0].image], do_resize=False, return_tensors="pt")["pixel_values"]
+    try:
+        observed = prepare_fx(copy.deepcopy(backbone), get_default_qconfig_mapping(engine), (example,))
+    except Exception as e:
+        print(f"Static backbone quantization is not possible: {e}")
+        return False
+
+    # Калибровка: наблюдатели собирают диапазоны активаций на реальных изображениях
+    model.model.backbone.conv_encoder.model = observed
+    with torch.no_grad():
+        for item in prepared:
+            detect_objects_batch([item.image], processor, model, torch.device("cpu"), target_sizes=[item.size])
+    try:
+        model.model.backbone.conv_encoder.model = convert_fx(observed)
+    except Exception as e:
+        print(f"Static backbone quantization failed, keeping float backbone: {e}")
+        model.model.backbone.conv_encoder.model = backbone
+        return False
+    return True
+
+def quantize_model(model, processor, calibration_images=None):
+    """INT8-модель для CPU: динамическая квантизация линейных слоёв и, если есть примеры, статическая — бэкбона.
+
+    Возвращает модель и признак того, что бэкбон действительно квантизован статически.
+    """
+    model = copy.deepcopy(model).float().eval()
+    static_backbone = bool(calibration_images) and quantize_backbone_static(model, processor, calibration_images)
+    return apply_precision(model, "int8"), static_backbone
+
+def quantized_precision(static_backbone):
+    """Метка точности сохранённой модели; None — файл без сведений о режиме."""
+    if static_backbone is None:
+        return "int8"
+    return "int8-static" if static_backbone else "int8-dynamic"
+
+def save_quantized(model, processor, path, static_backbone):
+    # Квантизованные модули не описываются state_dict стандартной модели, поэтому сохраняем модель целиком.
+    # Процессор и режим квантизации сохраняются рядом, чтобы сервер запускался без загрузки исходной модели
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    torch.save({"model": model, "processor": processor, "static_backbone": static_backbone}, path)
+
+def load_quantized(path):
+    """Загружает процессор, модель и режим квантизации, сохранённые Quantize.py (файл доверенный: загрузка через pickle)."""
+    saved = torch.load(path, map_location="cpu", weights_only=False)
+    return saved["processor"], saved["model"].eval(), saved.get("static_backbone")
+
+def check_accuracy(reference_model, quantized_model, processor, image_bytes, threshold=0.5):
+    """Совпадение детекций квантизованной модели с эталонной FP32 и задержки обеих."""
+    device = torch.device("cpu")
+    prepared = [prepare_image(data, default_resolution()) for data in image_bytes]
+    images, sizes = [p.image for p in prepared], [p.size for p in prepared]
+    report = {}
+    results = {}
+    with torch.inference_mode():
+        for name, candidate in (("fp32", reference_model), ("int8", quantized_model)):
+            run = lambda: detect_objects_batch(images, processor, candidate, device, target_sizes=sizes, threshold=threshold)
+            results[name] = run()
+            report[name] = measure(run, runs=3, warmup=1)
+    report["agreement"] = detection_agreement(results["fp32"], results["int8"])
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Калибровка и проверка INT8-модели для CPU")
+    parser.add_argument("--images", nargs="+", required=True, help="файлы или каталоги с изображениями для калибровки")
+    parser.add_argument("--check-images", nargs="*", help="изображения для проверки точности (по умолчанию --images)")
+    parser.add_argument("--output", default="models/detr-resnet50-int8.pt", help="куда сохранить квантизованную модель")
+    parser.add_argument("--tolerance", type=float, default=0.05, help="допустимая доля расхождений с FP32")
+    args = parser.parse_args()
+
+    processor, model = load_model(Config.MODEL_PATH, precision="fp32")
+    calibration = load_image_bytes(args.images)
+    quantized, static_backbone = quantize_model(model, processor, calibration)
+    print(f"Quantization mode: {quantized_precision(static_backbone)}")
+
+    report = check_accuracy(model, quantized, processor, load_image_bytes(args.check_images or args.images))
+    print(f"FP32: {report['fp32']}")
+    print(f"INT8: {report['int8']}")
+    print(f"Agreement with FP32: {report['agreement']}")
+    if report["agreement"] < 1 - args.tolerance:
+        print(f"Accuracy regression: agreement {report['agreement']} is below {1 - args.tolerance}")
+        sys.exit(1)
+
+    save_quantized(quantized, processor, args.output, static_backbone)
+    print(f"Quantized model saved to {args.output}")
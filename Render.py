@@ -0,0 +1,69 @@
+import io
+from functools import lru_cache
+
+from PIL import Image, ImageDraw, ImageFont
+
+@lru_cache(maxsize=16)
+def load_font(size=24):
+    """Загружает шрифт один раз на размер; если arial недоступен, берёт встроенный шрифт Pillow."""
+    try:
+        return ImageFont.truetype("arial.ttf", size)
+    except OSError:
+        pass
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1: встроенный растровый шрифт без выбора размера
+        return ImageFont.load_default()
+
+@lru_cache(maxsize=4096)
+def label_sprite(text, size=24, color="red"):
+    """Отрисованная подпись на прозрачном фоне; одинаковые подписи рисуются один раз."""
+    font = load_font(size)
+    left, top, right, bottom = font.getbbox(text)
+    sprite = Image.new("RGBA", (max(1, right - left), max(1, bottom - top)))
+    ImageDraw.Draw(sprite).text((-left, -top), text, fill=color, font=font)
+    return sprite
+
+def preview(image, max_side=None):
+    """Уменьшенная копия изображения для отрисовки (без изменений, если оно и так меньше max_side)."""
+    if max_side and max(image.size) > max_side:
+        image = image.copy()
+        image.thumbnail((max_side, max_side), Image.BILINEAR, reducing_gap=2.0)
+    return image
+
+def render_detections(image, columns, coord_size=None, max_side=None, font_size=24, color="red"):
+    """Рисует рамки и подписи из столбцов детекций.
+
+    coord_size — (ширина, высота) пространства координат рамок; по умолчанию совпадает с image.
+    max_side — рисовать на уменьшенной копии с этим ограничением по длинной стороне.
+    """
+    image = preview(image, max_side)
+    coord_size = coord_size or image.size
+    sx, sy = image.width / coord_size[0], image.height / coord_size[1]
+    draw = ImageDraw.Draw(image)
+    for label, confidence, (x0, y0, x1, y1) in zip(columns["labels"], columns["confidence"], columns["boxes"]):
+        box = [x0 * sx, y0 * sy, x1 * sx, y1 * sy]
+        draw.rectangle(box, outline=color, width=2)  # Рисуем прямоугольник
+        sprite = label_sprite(f"{label}: {round(confidence, 2)}", font_size, color)
+        image.paste(sprite, (round(box[0]) + 5, round(box[3])), sprite)  # Добавляем текст
+    return image
+
+# Форматы кодирования аннотированных изображений: имя для Pillow и MIME-тип
+IMAGE_FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+    "png": ("PNG", "image/png"),
+}
+
+def encode_image(image, image_format="jpeg", quality=85, progressive=True):
+    """Кодирует изображение в байты; возвращает пару (данные, MIME-тип)."""
+    pil_format, content_type = IMAGE_FORMATS[image_format]
+    buffer = io.BytesIO()
+    if pil_format == "JPEG":
+        image.save(buffer, pil_format, quality=quality, progressive=progressive)
+    elif pil_format == "WEBP":
+        image.save(buffer, pil_format, quality=quality, method=4)
+    else:
+        image.save(buffer, pil_format)
+    return buffer.getvalue(), content_type
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+class ResultCache:
+    """Кэш результатов детекции по хэшу содержимого изображения: LRU в памяти и необязательный уровень на диске."""
+
+    def __init__(self, max_items=1024, disk_dir=None, max_disk_items=100000):
+        self.max_items = max_items
+        self.disk_dir = disk_dir
+        self.max_disk_items = max_disk_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_puts = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def key(image_bytes, **params):
+        """Строит ключ из байтов изображения и параметров, влияющих на результат."""
+        digest = hashlib.sha256()
+        digest.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+        digest.update(image_bytes)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Возвращает сохранённый результат или None."""
+        if self.max_items <= 0 and not self.disk_dir:
+            return None
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+        value = self._read_disk(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, value)
+        return value
+
+    def put(self, key, value):
+        """Сохраняет результат в памяти и, если включено, на диске."""
+        with self._lock:
+            self._remember(key, value)
+        self._write_disk(key, value)
+
+    def stats(self):
+        """Счётчики попаданий и промахов для мониторинга."""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "items": len(self._items),
+            }
+
+    def _remember(self, key, value):
+        if self.max_items <= 0:
+            return
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], key + ".json")
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key, value):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Пишем во временный файл и переименовываем, чтобы читатели не увидели половину записи
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Failed to write cache entry {key}: {e}")
+            return
+        with self._lock:
+            self._disk_puts += 1
+            prune = self._disk_puts % 1000 == 0
+        if prune:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        # Удаляем самые старые файлы, если на диске больше max_disk_items записей
+        entries = []
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    entries.append((os.path.getmtime(path), path))
+                except OSError:
+                    pass
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self.max_disk_items)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
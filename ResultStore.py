@@ -0,0 +1,342 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+def new_task_id():
+    """Генерирует уникальный идентификатор задачи."""
+    return uuid.uuid4().hex
+
+def result_size(result):
+    """Приблизительный размер результата в байтах (по JSON-представлению)."""
+    return len(json.dumps(result, ensure_ascii=False).encode("utf-8"))
+
+class BaseResultStore:
+    """Общий интерфейс хранилищ результатов: put/get, фоновая очистка и обработка вытеснения."""
+
+    sweep_interval = 60
+    poll_interval = 0.25
+    on_evict = None
+
+    def start(self):
+        """Запускает фоновую очистку просроченных результатов."""
+        with self._lock:
+            if self._sweeper is None or not self._sweeper.is_alive():
+                self._sweeper = threading.Thread(target=self._sweep_loop, name="result-sweeper", daemon=True)
+                self._sweeper.start()
+
+    def put(self, task_id, result):
+        """Сохраняет результат задачи."""
+        raise NotImplementedError
+
+    def get(self, task_id):
+        """Возвращает результат задачи или None, если его нет или он просрочен."""
+        raise NotImplementedError
+
+    def sweep(self):
+        """Удаляет просроченные результаты и возвращает их количество."""
+        raise NotImplementedError
+
+    def put_blob(self, key, data, content_type):
+        """Сохраняет двоичные данные (например, аннотированное изображение) с тем же TTL, что и результаты."""
+        raise NotImplementedError
+
+    def get_blob(self, key):
+        """Возвращает пару (данные, content_type) или None."""
+        raise NotImplementedError
+
+    def wait(self, task_id, timeout):
+        """Ждёт появления результата до timeout секунд; возвращает результат или None."""
+        # Базовая реализация опрашивает хранилище; наследники могут получать уведомления
+        deadline = time.monotonic() + timeout
+        while True:
+            result = self.get(task_id)
+            remaining = deadline - time.monotonic()
+            if result is not None or remaining <= 0:
+                return result
+            time.sleep(min(self.poll_interval, remaining))
+
+    def _evicted(self, items):
+        if self.on_evict is None:
+            return
+        for task_id, result in items:
+            try:
+                self.on_evict(task_id, result)
+            except Exception as e:
+                print(f"Failed to clean up task {task_id}: {e}")
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                removed = self.sweep()
+            except Exception as e:
+                print(f"Result sweep failed: {e}")
+                continue
+            if removed:
+                print(f"Expired {removed} result(s)")
+
+class MemoryResultStore(BaseResultStore):
+    """Хранилище результатов в памяти процесса: TTL, LRU-вытеснение и ограничение по объёму."""
+
+    def __init__(self, ttl=3600, max_items=10000, max_bytes=64 * 1024 * 1024, sweep_interval=60, on_evict=None):
+        self.ttl = ttl
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self.on_evict = on_evict
+        self._items = OrderedDict()  # task_id или ("blob", key) -> (value, size, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._written = threading.Condition(self._lock)
+        self._sweeper = None
+
+    def put(self, task_id, result):
+        self._store(task_id, result, result_size(result))
+
+    def get(self, task_id):
+        return self._lookup(task_id)
+
+    def put_blob(self, key, data, content_type):
+        self._store(("blob", key), (data, content_type), len(data))
+
+    def get_blob(self, key):
+        return self._lookup(("blob", key))
+
+    def _store(self, key, value, size):
+        evicted = []
+        with self._lock:
+            if key in self._items:
+                evicted.append(self._pop(key))
+            self._items[key] = (value, size, time.monotonic() + self.ttl)
+            self._bytes += size
+            # Вытесняем самые давно использованные записи, пока не уложимся в лимиты
+            while len(self._items) > 1 and (len(self._items) > self.max_items or self._bytes > self.max_bytes):
+                evicted.append(self._pop(next(iter(self._items))))
+            self._written.notify_all()
+        self._evicted(evicted)
+
+    def _lookup(self, key):
+        expired = []
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            if item[2] <= time.monotonic():
+                expired.append(self._pop(key))
+                value = None
+            else:
+                self._items.move_to_end(key)
+                value = item[0]
+        self._evicted(expired)
+        return value
+
+    def wait(self, task_id, timeout):
+        deadline = time.monotonic() + timeout
+        with self._written:
+            while task_id not in self._items:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._written.wait(remaining)
+        return self.get(task_id)
+
+    def sweep(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [self._pop(task_id) for task_id, item in list(self._items.items()) if item[2] <= now]
+        self._evicted(expired)
+        return len(expired)
+
+    def __len__(self):
+        return len(self._items)
+
+    def _pop(self, key):
+        value, size, _ = self._items.pop(key)
+        self._bytes -= size
+        return key, value
+
+    def _evicted(self, items):
+        # Обработчик вытеснения вызывается только для результатов задач, не для двоичных данных
+        super()._evicted([(key, value) for key, value in items if not isinstance(key, tuple)])
+
+class SQLiteResultStore(BaseResultStore):
+    """Хранилище результатов в SQLite (режим WAL) — общее для нескольких процессов на одном хосте."""
+
+    def __init__(self, path, ttl=3600, max_items=10000, max_bytes=64 * 1024 * 1024, sweep_interval=60, on_evict=None):
+        self.path = path
+        self.ttl = ttl
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self.on_evict = on_evict
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sweeper = None
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS results ("
+                         "task_id TEXT PRIMARY KEY, body TEXT NOT NULL, "
+                         "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS blobs ("
+                         "key TEXT PRIMARY KEY, data BLOB NOT NULL, content_type TEXT NOT NULL, expires_at REAL NOT NULL)")
+
+    def _connection(self):
+        # Отдельное соединение на поток: sqlite3 не разрешает делить его между потоками
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def put(self, task_id, result):
+        now = time.time()
+        body = json.dumps(result, ensure_ascii=False)
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", (task_id, body, now + self.ttl, now))
+
+    def get(self, task_id):
+        now = time.time()
+        with self._connection() as conn:
+            row = conn.execute("SELECT body FROM results WHERE task_id = ? AND expires_at > ?", (task_id, now)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE results SET accessed_at = ? WHERE task_id = ?", (now, task_id))
+        return json.loads(row[0])
+
+    def put_blob(self, key, data, content_type):
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?)", (key, data, content_type, time.time() + self.ttl))
+
+    def get_blob(self, key):
+        row = self._connection().execute("SELECT data, content_type FROM blobs WHERE key = ? AND expires_at > ?",
+                                         (key, time.time())).fetchone()
+        return (bytes(row[0]), row[1]) if row is not None else None
+
+    def sweep(self):
+        # Лимиты по числу записей и объёму проверяются здесь, а не при каждой записи.
+        # Результаты и двоичные данные делят один лимит объёма: сверх него удаляются самые давние записи
+        # (результаты — по времени последнего чтения, двоичные данные — по времени записи)
+        with self._connection() as conn:
+            rows = [("result", *row) for row in conn.execute(
+                "SELECT task_id, length(body), expires_at, accessed_at FROM results")]
+            rows += [("blob", *row) for row in conn.execute(
+                "SELECT key, length(data), expires_at, expires_at - ? FROM blobs", (self.ttl,))]
+            rows.sort(key=lambda row: row[4], reverse=True)
+            now = time.time()
+            kept, kept_bytes, doomed, doomed_blobs = 0, 0, [], []
+            for kind, key, size, expires_at, _ in rows:
+                if kind == "blob":
+                    if expires_at <= now or kept_bytes + size > self.max_bytes:
+                        doomed_blobs.append((key, expires_at))
+                    else:
+                        kept_bytes += size
+                elif expires_at <= now or kept >= self.max_items or kept_bytes + size > self.max_bytes:
+                    doomed.append(key)
+                else:
+                    kept += 1
+                    kept_bytes += size
+            # Перезаписанные с тех пор данные не удаляются: у них другой срок жизни
+            conn.executemany("DELETE FROM blobs WHERE key = ? AND expires_at = ?", doomed_blobs)
+            evicted = []
+            for task_id in doomed:
+                row = conn.execute("SELECT body FROM results WHERE task_id = ?", (task_id,)).fetchone()
+                # Удаляет тот процесс, чей DELETE действительно затронул запись
+                if row is not None and conn.execute("DELETE FROM results WHERE task_id = ?", (task_id,)).rowcount:
+                    evicted.append((task_id, json.loads(row[0])))
+        self._evicted(evicted)
+        return len(evicted)
+
+class RedisResultStore(BaseResultStore):
+    """Хранилище результатов в Redis (или совместимом сервере) — общее для нескольких узлов."""
+
+    def __init__(self, url, ttl=3600, max_items=10000, sweep_interval=60, on_evict=None, prefix="detect:"):
+        import redis  # необязательная зависимость, нужна только для этого хранилища
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.max_items = max_items
+        self.sweep_interval = sweep_interval
+        self.on_evict = on_evict
+        self.prefix = prefix
+        self._index = prefix + "expires"
+        self._lock = threading.Lock()
+        self._sweeper = None
+
+    def put(self, task_id, result):
+        expires_at = time.time() + self.ttl
+        body = json.dumps({"expires_at": expires_at, "result": result}, ensure_ascii=False)
+        pipe = self.client.pipeline()
+        # Запас к TTL оставляет запись до прихода очистки, чтобы успеть удалить связанные файлы
+        pipe.set(self.prefix + task_id, body, ex=self.ttl + 2 * self.sweep_interval)
+        pipe.zadd(self._index, {task_id: expires_at})
+        pipe.publish(self.prefix + "done:" + task_id, "1")
+        pipe.execute()
+
+    def get(self, task_id):
+        body = self.client.get(self.prefix + task_id)
+        if body is None:
+            return None
+        item = json.loads(body)
+        return item["result"] if item["expires_at"] > time.time() else None
+
+    def put_blob(self, key, data, content_type):
+        name = self.prefix + "blob:" + key
+        pipe = self.client.pipeline()
+        pipe.hset(name, mapping={"data": data, "content_type": content_type})
+        pipe.expire(name, self.ttl)
+        pipe.execute()
+
+    def get_blob(self, key):
+        data, content_type = self.client.hmget(self.prefix + "blob:" + key, ["data", "content_type"])
+        return (data, content_type.decode()) if data is not None else None
+
+    def wait(self, task_id, timeout):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.prefix + "done:" + task_id)
+        try:
+            # Проверяем после подписки, чтобы не пропустить запись между get и subscribe
+            deadline = time.monotonic() + timeout
+            result = self.get(task_id)
+            while result is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                if pubsub.get_message(timeout=remaining) is not None:
+                    result = self.get(task_id)
+            return result
+        finally:
+            pubsub.close()
+
+    def sweep(self):
+        doomed = [task_id.decode() for task_id in self.client.zrangebyscore(self._index, 0, time.time())]
+        # Сверх лимита удаляем самые старые записи (Redis сам вытесняет по maxmemory)
+        overflow = self.client.zcard(self._index) - len(doomed) - self.max_items
+        if overflow > 0:
+            doomed += [task_id.decode() for task_id in self.client.zrange(self._index, len(doomed), len(doomed) + overflow - 1)]
+        evicted = []
+        for task_id in doomed:
+            # Удаляет тот процесс, которому удалось убрать запись из индекса
+            if not self.client.zrem(self._index, task_id):
+                continue
+            body, _ = self.client.pipeline().get(self.prefix + task_id).delete(self.prefix + task_id).execute()
+            evicted.append((task_id, json.loads(body)["result"] if body else {}))
+        self._evicted(evicted)
+        return len(evicted)
+
+def create_result_store(url, **kwargs):
+    """Создаёт хранилище по URL: memory://, sqlite:///path/to/results.db или redis://host:port/0."""
+    if url.startswith("memory://"):
+        return MemoryResultStore(**kwargs)
+    if url.startswith("sqlite:///"):
+        return SQLiteResultStore(url[len("sqlite:///"):], **kwargs)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        kwargs.pop("max_bytes", None)
+        return RedisResultStore(url, **kwargs)
+    raise ValueError(f"Unknown result store URL: {url}")
@@ -0,0 +1,108 @@
+import io
+import math
+from collections import namedtuple
+
+import numpy as np
+import torch
+from PIL import Image, ImageOps
+
+from Postprocess import box_iou
+from Preprocess import PreparedImage, fit_image, input_size
+
+# Параметры нарезки: сторона плитки в пикселях исходного изображения (None — наибольшая, которая идёт
+# в модель без уменьшения), доля перекрытия соседних плиток, способ объединения рамок (nms или wbf)
+# и IoU, при котором рамки считаются одним объектом
+TileSettings = namedtuple("TileSettings", ["size", "overlap", "merge", "iou"], defaults=(None, 0.2, "nms", 0.5))
+
+MERGE_METHODS = ("nms", "wbf")
+
+# Изображение, нарезанное на плитки: image и size — исходное изображение и его размер (пространство координат рамок),
+# tiles — пары (PreparedImage плитки, смещение плитки (x, y))
+TiledImage = namedtuple("TiledImage", ["image", "size", "tiles", "settings"])
+
+def tile_grid(width, height, tile_size, overlap):
+    """Окна (x0, y0, x1, y1), покрывающие изображение с перекрытием; последние окна прижаты к краю."""
+    step = max(1, int(tile_size * (1 - overlap)))
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        positions = list(range(0, length - tile_size, step))
+        return positions + [length - tile_size]
+
+    return [(x, y, min(x + tile_size, width), min(y + tile_size, height))
+            for y in starts(height) for x in starts(width)]
+
+def native_tile_size(policy):
+    """Наибольшая сторона квадратной плитки, которую политика разрешения не уменьшает."""
+    side = policy.shortest_edge
+    if policy.max_pixels:
+        side = min(side, math.isqrt(policy.max_pixels))
+    return max(1, side)
+
+def prepare_tiles(image_bytes, settings, policy):
+    """Декодирует изображение в исходном разрешении и готовит плитки к детекции.
+
+    Кроме плиток добавляется уменьшенное изображение целиком: крупные объекты, которые
+    не помещаются ни в одну плитку, находятся на нём. Изображение целиком приводится к входу
+    модели по политике разрешения policy. Плитки по умолчанию такого размера, что идут в модель
+    в исходном разрешении; плитка больше заданной settings.size уменьшается по той же политике.
+    """
+    # Плитки режутся из изображения, повёрнутого по EXIF, чтобы рамки совпали с тем, что видит пользователь
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(image_bytes)))
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    tiles = [(PreparedImage(fit_image(image, input_size(image.size, policy)), image.size), (0, 0))]
+    tile_size = settings.size or native_tile_size(policy)
+    for x0, y0, x1, y1 in tile_grid(image.width, image.height, tile_size, settings.overlap):
+        size = (x1 - x0, y1 - y0)
+        tile = image.crop((x0, y0, x1, y1))
+        tiles.append((PreparedImage(fit_image(tile, input_size(size, policy)), size), (x0, y0)))
+    return TiledImage(image, image.size, tiles, settings)
+
+def submit_tiles(tiled, submit):
+    """Отправляет все плитки на детекцию сразу (submit(prepared) возвращает Future), чтобы они шли полными пакетами."""
+    return [(submit(prepared), offset) for prepared, offset in tiled.tiles]
+
+def merge_tiles(tiled, futures):
+    """Дожидается результатов плиток и объединяет рамки в координатах исходного изображения."""
+    scores, labels, boxes = [], [], []
+    for future, (x, y) in futures:
+        result = future.result()
+        scores.append(result["scores"].float().cpu().numpy())
+        labels.append(result["labels"].cpu().numpy())
+        boxes.append(result["boxes"].float().cpu().numpy() + np.array([x, y, x, y], dtype=np.float32))
+    scores, labels, boxes = np.concatenate(scores), np.concatenate(labels), np.concatenate(boxes).reshape(-1, 4)
+    merge = weighted_boxes_fusion if tiled.settings.merge == "wbf" else nms
+    scores, labels, boxes = merge(scores, labels, boxes, tiled.settings.iou)
+    return {"scores": torch.from_numpy(scores), "labels": torch.from_numpy(labels), "boxes": torch.from_numpy(boxes)}
+
+def nms(scores, labels, boxes, iou_threshold=0.5):
+    """Подавление немаксимумов по классам: из перекрывающихся рамок остаётся самая уверенная."""
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size:
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        duplicate = (box_iou(boxes[best], boxes[rest])[0] >= iou_threshold) & (labels[rest] == labels[best])
+        order = rest[~duplicate]
+    keep = np.array(keep, dtype=np.int64)
+    return scores[keep], labels[keep], boxes[keep]
+
+def weighted_boxes_fusion(scores, labels, boxes, iou_threshold=0.5):
+    """Слияние рамок (WBF): перекрывающиеся рамки одного класса усредняются с весами по уверенности."""
+    clusters = []  # [label, объединённая рамка, список индексов]
+    for i in np.argsort(-scores, kind="stable"):
+        for cluster in clusters:
+            if cluster[0] == labels[i] and box_iou(cluster[1], boxes[i])[0, 0] >= iou_threshold:
+                cluster[2].append(i)
+                weights = scores[cluster[2]]
+                cluster[1] = (boxes[cluster[2]] * weights[:, None]).sum(axis=0) / weights.sum()
+                break
+        else:
+            clusters.append([labels[i], boxes[i], [i]])
+    if not clusters:
+        return scores[:0], labels[:0], boxes[:0]
+    return (np.array([scores[members].mean() for _, _, members in clusters], dtype=np.float32),
+            np.array([label for label, _, _ in clusters], dtype=labels.dtype),
+            np.array([box for _, box, _ in clusters], dtype=np.float32))
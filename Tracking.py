@@ -0,0 +1,79 @@
+import itertools
+
+import numpy as np
+from PIL import Image
+
+from Postprocess import box_iou
+
+# Сторона уменьшенной копии кадра, по которой оценивается изменение сцены
+SIGNATURE_SIDE = 32
+
+def frame_signature(image):
+    """Уменьшенная копия кадра в оттенках серого: дешёвая «подпись» для сравнения кадров."""
+    small = image.convert("L").resize((SIGNATURE_SIDE, SIGNATURE_SIDE), Image.BILINEAR, reducing_gap=2.0)
+    return np.asarray(small, dtype=np.float32)
+
+class FrameGate:
+    """Решает, нужен ли кадру полный прогон модели или можно повторить детекции предыдущего.
+
+    Кадр сравнивается с последним обработанным моделью (а не с соседним), поэтому медленные
+    изменения накапливаются и не теряются. threshold — средняя разница яркости (0–1), ниже
+    которой кадр считается тем же; max_reuse — сколько кадров подряд можно пропустить.
+    """
+
+    def __init__(self, threshold=0.02, max_reuse=10):
+        self.threshold = threshold
+        self.max_reuse = max_reuse
+        self._reference = None
+        self._reused = 0
+
+    def changed(self, image):
+        signature = frame_signature(image)
+        if (self._reference is not None and self._reused < self.max_reuse
+                and float(np.abs(signature - self._reference).mean()) / 255 < self.threshold):
+            self._reused += 1
+            return False
+        self._reference = signature
+        self._reused = 0
+        return True
+
+class IoUTracker:
+    """Переносит id объектов между кадрами: рамка получает id трека того же класса с наибольшим IoU.
+
+    Трек, не найденный в max_age кадрах подряд, удаляется.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_age=5):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self._tracks = []  # [id, label, box, missed]
+        self._ids = itertools.count(1)
+
+    def update(self, columns):
+        """Возвращает id для каждой рамки из столбцов детекций кадра."""
+        labels, boxes = columns["labels"], columns["boxes"]
+        ids = [None] * len(boxes)
+        matched = set()
+        if self._tracks and boxes:
+            iou = box_iou(boxes, [track[2] for track in self._tracks])
+            same_label = np.array(labels, dtype=object)[:, None] == np.array([track[1] for track in self._tracks], dtype=object)[None, :]
+            iou[~same_label] = 0
+            # Жадное сопоставление: сначала пары с наибольшим перекрытием
+            for i, j in zip(*np.unravel_index(np.argsort(-iou, axis=None), iou.shape)):
+                if iou[i, j] < self.iou_threshold:
+                    break
+                if ids[i] is None and j not in matched:
+                    ids[i] = self._tracks[j][0]
+                    self._tracks[j][2] = boxes[i]
+                    self._tracks[j][3] = 0
+                    matched.add(j)
+
+        for j, track in enumerate(self._tracks):
+            if j not in matched:
+                track[3] += 1
+        self._tracks = [track for track in self._tracks if track[3] <= self.max_age]
+        for i, track_id in enumerate(ids):
+            if track_id is None:
+                ids[i] = next(self._ids)
+                self._tracks.append([ids[i], labels[i], boxes[i], 0])
+        return ids
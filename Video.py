@@ -0,0 +1,129 @@
+import argparse
+import glob
+import io
+import json
+import os
+import sys
+from collections import deque, namedtuple
+
+from PIL import Image
+
+import Config
+
+# Кадр потока: порядковый номер в источнике, время в секундах и изображение PIL
+Frame = namedtuple("Frame", ["index", "time", "image"])
+
+# Расширения кадров, из которых собирается последовательность в каталоге
+FRAME_EXTENSIONS = ("*.jpg", "*.jpeg", "*.png", "*.webp", "*.bmp")
+
+def read_video(path):
+    """Декодирует видеофайл кадр за кадром (нужен opencv-python)."""
+    try:
+        import cv2
+    except ImportError:
+        raise RuntimeError("Video decoding requires opencv-python: pip install opencv-python-headless")
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"Cannot open video: {os.path.basename(path)}")
+    fps = capture.get(cv2.CAP_PROP_FPS) or Config.VIDEO_FRAME_RATE
+    try:
+        index = 0
+        while True:
+            ok, pixels = capture.read()
+            if not ok:
+                return
+            yield Frame(index, index / fps, Image.fromarray(cv2.cvtColor(pixels, cv2.COLOR_BGR2RGB)))
+            index += 1
+    finally:
+        capture.release()
+
+def read_image_sequence(sources, frame_rate=None):
+    """Кадры из последовательности изображений: пути к файлам или байты, декодируются по одному."""
+    frame_rate = frame_rate or Config.VIDEO_FRAME_RATE
+    for index, source in enumerate(sources):
+        image = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+        yield Frame(index, index / frame_rate, image)
+
+def read_frames(path, frame_rate=None):
+    """Кадры видеофайла или каталога с кадрами (упорядоченными по имени файла)."""
+    if os.path.isdir(path):
+        files = sorted(file for pattern in FRAME_EXTENSIONS for file in glob.glob(os.path.join(path, pattern)))
+        return read_image_sequence(files, frame_rate)
+    return read_video(path)
+
+def sample_frames(frames, sample_fps=None):
+    """Прореживает поток до sample_fps кадров в секунду по времени кадров (None — все кадры)."""
+    next_time = 0.0
+    for frame in frames:
+        if not sample_fps or frame.time >= next_time:
+            next_time = frame.time + 1.0 / sample_fps if sample_fps else 0.0
+            yield frame
+
+def detect_frames(frames, submit, prepare, max_in_flight=16, gate=None):
+    """Отправляет кадры на детекцию и отдаёт (кадр, результат, повторён ли результат) в исходном порядке.
+
+    submit(prepared) возвращает Future; одновременно в работе не больше max_in_flight кадров,
+    поэтому планировщик собирает полные пакеты, а видео никогда не хранится в памяти целиком.
+    Если gate (Tracking.FrameGate) считает кадр неизменившимся, он не идёт в модель, а получает
+    результат последнего обработанного кадра.
+    """
+    in_flight = deque()
+    future = None
+    for frame in frames:
+        reused = gate is not None and not gate.changed(frame.image)
+        if not reused:
+            future = submit(prepare(frame.image))
+        in_flight.append((frame, future, reused))
+        if len(in_flight) >= max_in_flight:
+            done, result, was_reused = in_flight.popleft()
+            yield done, result.result(), was_reused
+    while in_flight:
+        done, result, was_reused = in_flight.popleft()
+        yield done, result.result(), was_reused
+
+def frame_record(frame, detections, reused=False):
+    return {"frame": frame.index, "time": round(frame.time, 3), "reused": reused, "detections": detections}
+
+if __name__ == "__main__":
+    import torch
+
+    from Batcher import BatchScheduler
+    from Detect import load_model
+    from Postprocess import DetectOptions, LabelMap, columns_from_results, records_from_columns
+    from Precision import default_precision
+    from Preprocess import default_resolution, prepare_frame
+    from Tracking import FrameGate, IoUTracker
+
+    parser = argparse.ArgumentParser(description="Детекция объектов на видео или последовательности кадров (вывод в NDJSON)")
+    parser.add_argument("source", help="видеофайл или каталог с кадрами")
+    parser.add_argument("--fps", type=float, default=Config.VIDEO_SAMPLE_FPS, help="сколько кадров в секунду обрабатывать (0 — все)")
+    parser.add_argument("--threshold", type=float, default=DetectOptions().threshold)
+    parser.add_argument("--change-threshold", type=float, default=Config.VIDEO_CHANGE_THRESHOLD,
+                        help="минимальное изменение кадра (0–1) для нового прогона модели; 0 — прогонять каждый кадр")
+    parser.add_argument("--output", help="файл NDJSON (по умолчанию stdout)")
+    args = parser.parse_args()
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    processor, model = load_model(Config.MODEL_PATH, precision=default_precision(device))
+    model = model.to(device)
+    scheduler = BatchScheduler(processor, model, device, max_batch_size=Config.BATCH_MAX_SIZE, max_wait=Config.BATCH_MAX_WAIT)
+    scheduler.start()
+    label_map = LabelMap(model.config.id2label)
+    options = DetectOptions(threshold=args.threshold)
+
+    frames = sample_frames(read_frames(args.source), args.fps)
+    resolution = default_resolution()
+    prepare = lambda image: prepare_frame(image, resolution)
+    gate = FrameGate(args.change_threshold, Config.VIDEO_MAX_REUSE) if args.change_threshold > 0 else None
+    tracker = IoUTracker(Config.TRACK_IOU, Config.TRACK_MAX_AGE)
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for frame, results, reused in detect_frames(frames, lambda prepared: scheduler.submit(prepared, options), prepare,
+                                                    Config.VIDEO_MAX_IN_FLIGHT, gate):
+            columns = columns_from_results(results, label_map)
+            columns["ids"] = tracker.update(columns)
+            output.write(json.dumps(frame_record(frame, records_from_columns(columns), reused)) + "\n")
+            output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
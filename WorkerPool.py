@@ -0,0 +1,48 @@
+import queue
+import threading
+from concurrent.futures import Future
+
+class QueueFullError(Exception):
+    """Очередь задач заполнена, новую задачу принять нельзя."""
+
+class WorkerPool:
+    """Фиксированный пул рабочих потоков с ограниченной очередью задач."""
+
+    def __init__(self, workers=8, queue_size=32, name="worker"):
+        self.workers = workers
+        self.name = name
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Запускает рабочие потоки (повторный вызов ничего не делает)."""
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            for i in range(len(self._threads), self.workers):
+                thread = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, fn, *args, **kwargs):
+        """Ставит задачу в очередь; при переполнении бросает QueueFullError."""
+        future = Future()
+        try:
+            self._queue.put_nowait((future, fn, args, kwargs))
+        except queue.Full:
+            raise QueueFullError(f"{self.name} queue is full ({self._queue.maxsize} tasks)")
+        return future
+
+    def pending(self):
+        """Количество задач, ожидающих в очереди."""
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            future, fn, args, kwargs = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
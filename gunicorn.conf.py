@@ -0,0 +1,45 @@
+# Запуск: gunicorn -c gunicorn.conf.py mainDetect:app
+#
+# Модель загружается один раз в мастер-процессе (preload_app), рабочие процессы
+# получают её после fork и делят страницы с весами в режиме copy-on-write.
+import gc
+import os
+
+from Config import env_int
+from Memory import memory_usage, format_memory
+
+bind = os.environ.get("DETECT_BIND", "0.0.0.0:5000")
+workers = env_int("DETECT_PROCESSES", 2)
+worker_class = "gthread"
+threads = env_int("DETECT_HTTP_THREADS", 16)
+timeout = 300
+preload_app = True
+
+def on_starting(server):
+    import Config
+
+    # Хранилище в памяти у каждого процесса своё: статус задачи, попавший в другой процесс,
+    # ждал бы до таймаута и не получил результат
+    if server.num_workers > 1 and Config.RESULT_STORE.startswith("memory://"):
+        server.log.warning("DETECT_RESULT_STORE=memory:// is per-process, running 1 worker instead of %s; "
+                           "use sqlite:// or redis:// for several workers", server.num_workers)
+        server.num_workers = 1
+
+def pre_fork(server, worker):
+    # Заморозка объектов мастера: сборщик мусора не будет трогать их заголовки и копировать страницы
+    gc.collect()
+    gc.freeze()
+
+def post_fork(server, worker):
+    import torch
+
+    torch_threads = env_int("DETECT_TORCH_THREADS", 0)
+    if torch_threads:
+        # Без ограничения каждый процесс займёт все ядра и они будут мешать друг другу
+        torch.set_num_threads(torch_threads)
+
+def post_worker_init(worker):
+    import mainDetect
+
+    mainDetect.start_services()
+    worker.log.info("Worker %s memory: %s", worker.pid, format_memory(memory_usage()))
@@ -1,24 +1,120 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for
+from flask import Flask, Response, request, jsonify, render_template, redirect, url_for, stream_with_context
 from Detect import *
+from Batcher import BatchScheduler
+from WorkerPool import WorkerPool, QueueFullError
+from ResultStore import create_result_store, new_task_id
+from ResultCache import ResultCache
+from Fetcher import UrlFetcher, then, completed
+from Preprocess import RESOLUTION_TIERS, default_resolution, resolution_policy, prepare_image, prepare_frame
+from Render import render_detections, encode_image
+from Memory import memory_usage, format_memory
+from Precision import apply_precision, check_precision, default_precision
+from Engine import create_engine, warm_up
+from Video import read_frames, read_video, read_image_sequence, sample_frames, detect_frames, frame_record
+from Tracking import FrameGate, IoUTracker
+from Tiling import TileSettings, TiledImage, MERGE_METHODS, prepare_tiles, submit_tiles, merge_tiles
+from Postprocess import DetectOptions, LabelMap, filter_results, columns_from_results, records_from_columns
+import Config
 import torch
-from PIL import Image
-import io
-import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, TimeoutError as FutureTimeoutError, wait as wait_futures
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+import zipfile
+import zlib
+from werkzeug.utils import safe_join
 
 app = Flask(__name__)
+app.config['MAX_CONTENT_LENGTH'] = Config.MAX_UPLOAD_MB * 1024 * 1024
 
 # Загрузка модели при запуске сервера
-processor, model = load_model("detr_resnet50_fp16.pth")
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-model.to(device)
 
-print(f"Model is running on device: {device}")
-
-# Переменная для масштабирования изображения
-scale_factor = 2
-
-# Глобальная переменная для хранения результатов
-results_store = {}
+# Режим точности: готовая INT8-модель, выбранный замером, по умолчанию для устройства или явно заданный
+if Config.QUANTIZED_MODEL:
+    from Quantize import load_quantized, quantized_precision
+
+    # Квантизованные ядра работают только на CPU; процессор и конфигурация берутся из файла модели,
+    # исходная модель не загружается
+    device = torch.device("cpu")
+    processor, model, static_backbone = load_quantized(Config.QUANTIZED_MODEL)
+    precision = quantized_precision(static_backbone)
+elif Config.PRECISION == "benchmark":
+    from Benchmark import select_precision, load_image_bytes, default_image_bytes
+
+    processor, model = load_model(Config.MODEL_PATH, precision=None)
+    sample_images = load_image_bytes([Config.BENCHMARK_IMAGES]) if Config.BENCHMARK_IMAGES else []
+    precision, _ = select_precision(processor, model, device, sample_images or [default_image_bytes()])
+    model = apply_precision(model, precision).to(device)
+else:
+    precision = default_precision(device) if Config.PRECISION == "auto" else Config.PRECISION
+    # Неподдерживаемый режим (например, int8 на CUDA) останавливает запуск, а не каждый запрос
+    check_precision(precision, device)
+    processor, model = load_model(Config.MODEL_PATH, precision=precision)
+    model = model.to(device)
+
+# Движок исполнения прогревается на типичных формах входа до приёма запросов
+model_checkpoint = f"{checkpoint_id(Config.QUANTIZED_MODEL or Config.MODEL_PATH)}:{precision}"
+engine = create_engine(Config.ENGINE, model, processor, device, onnx_path=Config.ONNX_PATH, source=model_checkpoint)
+warm_up(engine, processor, device, batch_sizes=sorted({1, Config.BATCH_MAX_SIZE}), policy=default_resolution())
+
+print(f"Model is running on device: {device} ({precision}, {engine.name})")
+
+# Планировщик пакетного инференса: все запросы проходят через одну очередь
+scheduler = BatchScheduler(processor, engine, device, max_batch_size=Config.BATCH_MAX_SIZE, max_wait=Config.BATCH_MAX_WAIT)
+
+# Ограниченный пул обработчиков вместо отдельного потока на каждый запрос
+worker_pool = WorkerPool(workers=Config.WORKER_THREADS, queue_size=Config.TASK_QUEUE_SIZE, name="detect")
+
+# Отдельный пул для отрисовки и кодирования аннотированных изображений
+encoder_pool = WorkerPool(workers=Config.ENCODER_THREADS, queue_size=Config.TASK_QUEUE_SIZE, name="encode")
+
+# Загрузка изображений по URL вынесена в отдельную стадию со своими лимитами
+fetcher = UrlFetcher(workers=Config.FETCH_WORKERS, queue_size=Config.FETCH_QUEUE_SIZE, per_host=Config.FETCH_PER_HOST,
+                     connect_timeout=Config.FETCH_CONNECT_TIMEOUT, read_timeout=Config.FETCH_READ_TIMEOUT,
+                     max_bytes=Config.MAX_UPLOAD_MB * 1024 * 1024)
+
+# Разрешение входа модели по умолчанию; запрос может выбрать другой уровень или бюджет пикселей
+resolution = default_resolution()
+
+# Кэш результатов по хэшу изображения, чтобы не прогонять модель повторно
+result_cache = ResultCache(max_items=Config.CACHE_MAX_ITEMS, disk_dir=Config.CACHE_DIR or None)
+model_checkpoint = ":".join(filter(None, (model_checkpoint, engine.name, engine.artifact)))
+
+# Названия классов для векторного постпроцессинга
+label_map = LabelMap(model.config.id2label)
+
+def cache_key(image_bytes, options, tiling=None, policy=None):
+    return result_cache.key(image_bytes, model=model_checkpoint, resolution=policy or resolution, tiling=tiling, **options._asdict())
+
+# Хранилище результатов с ограничением по времени жизни и объёму (память, SQLite или Redis)
+results_store = create_result_store(Config.RESULT_STORE, ttl=Config.RESULT_TTL, max_items=Config.RESULT_MAX_ITEMS,
+                                    max_bytes=Config.RESULT_MAX_MB * 1024 * 1024)
+
+# Фоновые потоки запускаются отдельно от загрузки модели: при preload_app мастер
+# загружает модель, а потоки создаются уже в каждом рабочем процессе после fork
+_services_pid = None
+
+def start_services():
+    """Запускает фоновые потоки в текущем процессе (повторный вызов ничего не делает)."""
+    global _services_pid
+    if _services_pid == os.getpid():
+        return
+    _services_pid = os.getpid()
+    scheduler.start()
+    worker_pool.start()
+    encoder_pool.start()
+    fetcher.start()
+    results_store.start()
+    print(f"Services started in process {os.getpid()}: {format_memory(memory_usage())}")
+
+@app.before_request
+def ensure_services():
+    start_services()
 
 @app.route('/')
 def index():
@@ -28,11 +124,26 @@ def index():
 def about():
     return render_template('about.html')
 
+def busy_response():
+    return jsonify({"error": "Server is busy, try again later"}), 503, {"Retry-After": str(Config.RETRY_AFTER)}
+
+@app.errorhandler(QueueFullError)
+def queue_full(e):
+    print("Rejecting request:", e)
+    return busy_response()
+
+@app.errorhandler(413)
+def too_large(e):
+    return jsonify({"error": f"File is too large (max {Config.MAX_UPLOAD_MB} MB)"}), 413
+
 @app.route('/loading')
 def loading():
     task_id = request.args.get('task_id')
     return render_template('loading.html', task_id=task_id)
 
+# Ключ загрузки в IndexedDB браузера: отметка времени и случайный суффикс
+UPLOAD_KEY = re.compile(r"[A-Za-z0-9-]{1,64}")
+
 @app.route('/detect', methods=['POST'])
 def detect():
     client_ip = request.remote_addr
@@ -42,63 +153,143 @@ def detect():
         print("No image provided")
         return jsonify({"error": "No image provided"}), 400
 
-    image_file = request.files['image']
+    image_bytes = request.files['image'].read()
     show_image = 'show_image' in request.form
-    task_id = str(len(results_store) + 1)
+    # render=client: браузер сам рисует рамки поверх исходного файла, сервер возвращает только JSON.
+    # upload_key — ключ, под которым страница сохранила файл в IndexedDB; он возвращается в результате
+    upload_key = request.form.get('upload_key', '')
+    client_render = show_image and request.form.get('render') == 'client' and UPLOAD_KEY.fullmatch(upload_key) is not None
+    options = parse_detect_options(request.form)
+    task_id = new_task_id()
 
     print("Starting image processing...")
-    
-    # Запускаем обработку изображения в отдельном потоке
-    thread = threading.Thread(target=process_image_task, args=(image_file, show_image, task_id))
-    thread.start()
+
+    # Ставим обработку в очередь пула; при переполнении вернётся 503
+    worker_pool.submit(process_image_task, image_bytes, show_image and not client_render, task_id, options,
+                       extra={"render": "client", "upload_key": upload_key} if client_render else None)
 
     # Перенаправляем на страницу ожидания с task_id
     print("Redirecting to loading page...")
     return redirect(url_for('loading', task_id=task_id))
 
-def process_image_task(image_file, show_image, task_id):
-    image_bytes = image_file.read()
-    image = Image.open(io.BytesIO(image_bytes))
-    if image.format == 'WEBP':
-        image = image.convert("RGB")
-    if image.mode != "RGB":
-        image = image.convert("RGB")
-
-    image = resize_image(image, scale_factor)
+def process_image_task(image_bytes, show_image, task_id, options=DetectOptions(), columnar=False, extra=None, tiling=None, policy=None):
+    result = run_image_task(image_bytes, show_image, task_id, options, columnar, tiling, policy)
+    if extra and result is not None and 'error' not in result:
+        result.update(extra)
+    # None — результат запишет пул кодирования после подготовки изображения
+    if result is not None:
+        results_store.put(task_id, result)
+        print("Processing complete for task:", task_id)
+    return result
+
+def run_image_task(image_bytes, show_image, task_id, options=DetectOptions(), columnar=False, tiling=None, policy=None):
+    key = cache_key(image_bytes, options, tiling, policy)
+    columns = result_cache.get(key)
+    if columns is not None and not show_image:
+        return detection_result(columns, columnar)
 
-    print("Processing image...")
     try:
-        results = detect_objects(image, processor, model, device)
+        prepared = prepare_input(image_bytes, tiling, policy)
     except Exception as e:
-        results_store[task_id] = {"error": f"Detection failed: {str(e)}"}
-        return
+        return {"error": f"Invalid image: {str(e)}"}
 
-    detections = []
-    for score, label, box in zip(results["scores"], results["labels"], results["boxes"]):
-        box = [round(i, 2) for i in box.tolist()]
-        detections.append({
-            "label": model.config.id2label[label.item()],
-            "confidence": round(score.item(), 3),
-            "box": box
-        })
+    print("Processing image...")
+    return run_detection(prepared, show_image, task_id, key, options, columns, columnar)
+
+def prepare_input(image_bytes, tiling=None, policy=None):
+    # Рамки в обоих режимах возвращаются в координатах исходного изображения
+    if tiling is not None:
+        return prepare_tiles(image_bytes, tiling, policy or resolution)
+    return prepare_image(image_bytes, policy or resolution)
+
+def submit_detection(prepared, options):
+    """Ставит изображение (или все его плитки) в планировщик; возвращает функцию ожидания результата."""
+    if isinstance(prepared, TiledImage):
+        # Ограничение числа рамок применяется после объединения плиток, а не к каждой плитке
+        tile_options = options._replace(max_detections=None)
+        futures = submit_tiles(prepared, lambda tile: scheduler.submit(tile, tile_options))
+        # Рамки плиток объединяются в потоке обработчика, а не в потоке инференса
+        return lambda: filter_results(merge_tiles(prepared, futures), options)
+    return scheduler.submit(prepared, options).result
+
+def detection_result(columns, columnar, **extra):
+    # Столбцовый формат компактнее: названия полей не повторяются для каждой рамки
+    return {"detections": columns if columnar else records_from_columns(columns), **extra}
+
+def run_detection(prepared, show_image, task_id, key, options, columns=None, columnar=False):
+    if columns is None:
+        try:
+            results = submit_detection(prepared, options)()
+        except Exception as e:
+            return {"error": f"Detection failed: {str(e)}"}
+        columns = columns_from_results(results, label_map)
+        result_cache.put(key, columns)
 
     if show_image:
-        image_with_boxes = draw_boxes(image, results, model)
-        image_with_boxes.save(f"static/output_with_boxes_{task_id}.jpg")
-        results_store[task_id] = {"detections": detections, "image_url": f"static/output_with_boxes_{task_id}.jpg"}
-    else:
-        results_store[task_id] = {"detections": detections}
-
+        # Отрисовка и кодирование идут в отдельном пуле, обработчик модели освобождается сразу
+        result = detection_result(columns, columnar, image_url=f"/task_image/{task_id}")
+        try:
+            encoder_pool.submit(encode_task, prepared, columns, task_id, result)
+        except QueueFullError:
+            encode_task(prepared, columns, task_id, result)
+        return None
+    return detection_result(columns, columnar)
+
+def encode_task(prepared, columns, task_id, result):
+    try:
+        # Рисуем на изображении в размере входа модели (или его уменьшенной копии), пересчитывая рамки
+        image_with_boxes = render_detections(prepared.image, columns, prepared.size, max_side=Config.RENDER_MAX_SIDE)
+        data, content_type = encode_image(image_with_boxes, Config.IMAGE_FORMAT, Config.IMAGE_QUALITY, Config.IMAGE_PROGRESSIVE)
+        results_store.put_blob(task_id, data, content_type)
+    except Exception as e:
+        result = {"error": f"Rendering failed: {str(e)}"}
+    results_store.put(task_id, result)
     print("Processing complete for task:", task_id)
 
+@app.route('/task_image/<task_id>')
+def task_image(task_id):
+    """Аннотированное изображение задачи из хранилища результатов."""
+    blob = results_store.get_blob(task_id)
+    if blob is None:
+        return render_template('404.html'), 404
+    data, content_type = blob
+    response = Response(data, mimetype=content_type)
+    # Изображение задачи не меняется, поэтому браузер может кэшировать его до истечения TTL
+    response.set_etag(hashlib.sha1(data).hexdigest())
+    response.cache_control.private = True
+    response.cache_control.max_age = Config.RESULT_TTL
+    return response.make_conditional(request)
+
 @app.route('/task_status/<task_id>')
 def task_status(task_id):
-    result = results_store.get(task_id)
+    # Long-poll: с параметром wait ответ задерживается до готовности результата
+    wait = min(request.args.get('wait', 0, type=float), Config.EVENT_TIMEOUT)
+    result = results_store.wait(task_id, wait) if wait > 0 else results_store.get(task_id)
     if result:
         return jsonify(result)
     else:
         return jsonify({"status": "processing"}), 202
 
+@app.route('/task_events/<task_id>')
+def task_events(task_id):
+    """Поток Server-Sent Events: событие result приходит сразу после записи результата."""
+    def events():
+        deadline = time.monotonic() + Config.EVENT_TIMEOUT
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                yield "event: timeout\ndata: {}\n\n"
+                return
+            result = results_store.wait(task_id, min(Config.EVENT_KEEPALIVE, remaining))
+            if result is not None:
+                yield f"event: result\ndata: {json.dumps(result)}\n\n"
+                return
+            # Комментарий удерживает соединение через прокси
+            yield ": keepalive\n\n"
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(events()), mimetype="text/event-stream", headers=headers)
+
 @app.route('/detect_url', methods=['POST'])
 def detect_url():
     client_ip = request.remote_addr
@@ -106,52 +297,330 @@ def detect_url():
 
     url = request.form.get('url')
     show_image = 'show_image' in request.form
+    client_render = show_image and request.form.get('render') == 'client'
     if not url:
         return jsonify({"error": "No URL provided"}), 400
 
-    task_id = str(len(results_store) + 1)
-    thread = threading.Thread(target=process_url_task, args=(url, show_image, task_id))
-    thread.start()
+    options = parse_detect_options(request.form)
+    task_id = new_task_id()
+    if client_render:
+        submit_url_task(url, False, task_id, options, extra={"render": "client", "source_url": url})
+    else:
+        submit_url_task(url, show_image, task_id, options)
 
     # Перенаправляем на страницу ожидания с task_id
     print("Redirecting to loading page...")
     return redirect(url_for('loading', task_id=task_id))
 
-def process_url_task(url, show_image, task_id):
+def submit_url_task(url, show_image, task_id, options=DetectOptions(), extra=None):
+    # Загрузка идёт в отдельном пуле, обработчики модели получают уже скачанные байты
+    def handoff(fetched):
+        try:
+            image_bytes = fetched.result()
+        except Exception as e:
+            result = {"error": f"load url: {str(e)}"}
+            results_store.put(task_id, result)
+            return completed(result)
+        print("Processing URL image...")
+        return submit_after_fetch(task_id, process_image_task, image_bytes, show_image, task_id, options, extra=extra)
+
+    return then(fetcher.submit(url), handoff)
+
+def submit_after_fetch(task_id, fn, *args, **kwargs):
+    # Запрос уже получил ответ, поэтому переполнение очереди записываем в результат задачи
     try:
-        image = load_image_from_url(url)
-        if image.format == 'WEBP':
-            image = image.convert("RGB")
-        if image.mode != "RGB":
-            image = image.convert("RGB")
-    except Exception as e:
-        results_store[task_id] = {"error": f"load url: {str(e)}"}
-
-    image = resize_image(image, scale_factor)
+        return worker_pool.submit(fn, *args, **kwargs)
+    except QueueFullError:
+        result = {"error": "Server is busy, try again later"}
+        results_store.put(task_id, result)
+        return completed(result)
+
+def parse_flag(value):
+    return value is not None and value.lower() in ("1", "true", "yes", "on")
+
+class InvalidParameter(Exception):
+    """Неверный параметр запроса."""
+
+@app.errorhandler(InvalidParameter)
+def invalid_parameter(e):
+    return jsonify({"error": str(e)}), 400
+
+def parse_detect_options(values):
+    """Читает threshold, max_detections и classes (названия через запятую) из параметров запроса."""
+    threshold = values.get('threshold', DEFAULT_THRESHOLD, type=float)
+    if not 0 <= threshold <= 1:
+        raise InvalidParameter("threshold must be between 0 and 1")
+    max_detections = values.get('max_detections', type=int)
+    if max_detections is not None and max_detections < 1:
+        raise InvalidParameter("max_detections must be positive")
+    classes = values.get('classes')
+    if classes:
+        try:
+            classes = label_map.ids([name.strip() for name in classes.split(',') if name.strip()])
+        except ValueError as e:
+            raise InvalidParameter(str(e))
+    return DetectOptions(threshold, max_detections, classes or None)
+
+def parse_tiling(values):
+    """Режим плиток для больших изображений: tiling=1 или tile_size, а также tile_overlap, merge и merge_iou."""
+    if not parse_flag(values.get('tiling')) and 'tile_size' not in values:
+        return None
+    tile_size = values.get('tile_size', Config.TILE_SIZE, type=int)
+    if ('tile_size' in values and tile_size is None) or (tile_size is not None and tile_size < 64):
+        raise InvalidParameter("tile_size must be at least 64")
+    overlap = values.get('tile_overlap', Config.TILE_OVERLAP, type=float)
+    if overlap is None or not 0 <= overlap < 1:
+        raise InvalidParameter("tile_overlap must be between 0 and 1")
+    merge = values.get('merge', Config.TILE_MERGE)
+    if merge not in MERGE_METHODS:
+        raise InvalidParameter(f"merge must be one of {', '.join(MERGE_METHODS)}")
+    iou = values.get('merge_iou', Config.TILE_IOU, type=float)
+    if iou is None or not 0 < iou <= 1:
+        raise InvalidParameter("merge_iou must be between 0 and 1")
+    return TileSettings(tile_size, overlap, merge, iou)
+
+def parse_resolution(values):
+    """Разрешение входа модели: уровень tier (fast, balanced, accurate), shortest_edge и max_pixels."""
+    tier = values.get('tier')
+    shortest_edge = values.get('shortest_edge', type=int)
+    max_pixels = values.get('max_pixels', type=int)
+    if tier is None and shortest_edge is None and max_pixels is None:
+        return None
+    if tier is not None and tier not in RESOLUTION_TIERS:
+        raise InvalidParameter(f"tier must be one of {', '.join(RESOLUTION_TIERS)}")
+    if shortest_edge is not None and not 32 <= shortest_edge <= 2000:
+        raise InvalidParameter("shortest_edge must be between 32 and 2000")
+    if max_pixels is not None and max_pixels < 32 * 32:
+        raise InvalidParameter("max_pixels must be at least 1024")
+    return resolution_policy(tier or Config.RESOLUTION_TIER, shortest_edge or Config.RESOLUTION_SHORTEST_EDGE,
+                             max_pixels or Config.RESOLUTION_MAX_PIXELS)
+
+@app.route('/api/v1/detect', methods=['POST'])
+def api_detect():
+    """Синхронная детекция: принимает изображение (multipart или сырые байты) и сразу возвращает JSON."""
+    if request.mimetype == 'multipart/form-data':
+        image = request.files.get('image')
+        image_bytes = image.read() if image else b""
+        values = request.values
+    else:
+        # Сырые байты читаются до обращения к форме: иначе Werkzeug разберёт тело как форму
+        # (curl --data-binary по умолчанию шлёт application/x-www-form-urlencoded), а параметры берутся только из URL
+        image_bytes = request.get_data()
+        values = request.args
+    if not image_bytes:
+        return jsonify({"error": "No image provided"}), 400
 
-    print("Processing URL image...")
-    try:
-        results = detect_objects(image, processor, model, device)
-    except Exception as e:
-        results_store[task_id] = {"error": f"Detection failed: {str(e)}"}
+    show_image = parse_flag(request.args.get('show_image'))
+    timeout = min(request.args.get('timeout', Config.API_TIMEOUT, type=float), Config.API_MAX_TIMEOUT)
+    columnar = request.args.get('format') == 'columnar'
+    options = parse_detect_options(values)
+    tiling = parse_tiling(values)
+    policy = parse_resolution(values)
+    task_id = new_task_id()
 
-    detections = []
-    for score, label, box in zip(results["scores"], results["labels"], results["boxes"]):
-        box = [round(i, 2) for i in box.tolist()]
-        detections.append({
-            "label": model.config.id2label[label.item()],
-            "confidence": round(score.item(), 3),
-            "box": box
-        })
+    future = worker_pool.submit(process_image_task, image_bytes, show_image, task_id, options, columnar, tiling=tiling, policy=policy)
+    return wait_for_task(future, task_id, timeout)
 
-    if show_image:
-        image_with_boxes = draw_boxes(image, results, model)
-        image_with_boxes.save(f"static/output_with_boxes_{task_id}.jpg")
-        results_store[task_id] = {"detections": detections, "image_url": f"static/output_with_boxes_{task_id}.jpg"}
+def wait_for_task(future, task_id, timeout):
+    deadline = time.monotonic() + timeout
+    try:
+        result = future.result(timeout=timeout)
+        if result is None:
+            # Результат ещё кодируется в отдельном пуле — ждём его появления в хранилище
+            result = results_store.wait(task_id, max(0, deadline - time.monotonic()))
+        if result is None:
+            raise FutureTimeoutError()
+    except FutureTimeoutError:
+        # Задача продолжает выполняться; результат можно забрать через /task_status
+        return jsonify({"status": "processing", "task_id": task_id,
+                        "status_url": url_for('task_status', task_id=task_id)}), 202
+
+    return jsonify({"task_id": task_id, **result}), 422 if 'error' in result else 200
+
+@app.route('/api/v1/detect_batch', methods=['POST'])
+def api_detect_batch():
+    """Пакетная детекция: список файлов, zip-архив или список URL (по одному на строку)."""
+    try:
+        items = collect_batch_items()
+    except (ValueError, zipfile.BadZipFile) as e:
+        return jsonify({"error": str(e)}), 400
+    if not items:
+        return jsonify({"error": "No images provided"}), 400
+    if len(items) > Config.BATCH_MAX_IMAGES:
+        return jsonify({"error": f"Too many images (max {Config.BATCH_MAX_IMAGES})"}), 400
+
+    timeout = min(request.args.get('timeout', 0, type=float), Config.API_MAX_TIMEOUT)
+    columnar = request.args.get('format') == 'columnar'
+    options = parse_detect_options(request.args)
+    tiling = parse_tiling(request.args)
+    policy = parse_resolution(request.args)
+    task_id = new_task_id()
+    print(f"Starting batch of {len(items)} image(s), task:", task_id)
+
+    # URL скачиваются внутри задачи по мере продвижения окна; переполнение пула обработчиков вернёт 503 с Retry-After
+    future = worker_pool.submit(process_batch_task, items, task_id, options, columnar, tiling, policy)
+    return wait_for_task(future, task_id, timeout)
+
+class ArchiveEntryError(Exception):
+    """Файл zip-архива, который не удалось распаковать (зашифрован, повреждён или сжат неподдерживаемым методом)."""
+
+def read_archive_entry(archive, info):
+    try:
+        return archive.read(info)
+    except (RuntimeError, NotImplementedError, EOFError, zipfile.BadZipFile, zlib.error) as e:
+        return ArchiveEntryError(str(e))
+
+def collect_batch_items():
+    """Собирает элементы пакета как пары (имя, байты) или (URL, None) — URL скачиваются позже.
+
+    Файл архива, который не удалось распаковать, становится ошибкой этого изображения, а не всего пакета.
+    """
+    items = [(f.filename or f"image_{i}", f.read()) for i, f in enumerate(request.files.getlist('images'))]
+
+    if 'archive' in request.files:
+        with zipfile.ZipFile(request.files['archive']) as archive:
+            entries = [info for info in archive.infolist() if not info.is_dir()]
+            # Защита от zip-бомб: распакованный объём не больше лимита загрузки
+            if sum(info.file_size for info in entries) > app.config['MAX_CONTENT_LENGTH']:
+                raise ValueError("Archive is too large when unpacked")
+            items += [(info.filename, read_archive_entry(archive, info)) for info in entries]
+
+    urls = request.form.get('urls')
+    if urls is None and request.mimetype == 'text/plain':
+        urls = request.get_data(as_text=True)
+    if urls:
+        items += [(line.strip(), None) for line in urls.splitlines() if line.strip()]
+    return items
+
+def process_batch_task(items, task_id, options=DetectOptions(), columnar=False, tiling=None, policy=None):
+    result = run_batch_task(items, options, columnar, tiling, policy)
+    results_store.put(task_id, result)
+    print("Processing complete for batch task:", task_id)
+    return result
+
+def run_batch_task(items, options=DetectOptions(), columnar=False, tiling=None, policy=None):
+    """Обрабатывает пакет окном из BATCH_MAX_IN_FLIGHT изображений.
+
+    Как в Video.detect_frames, одновременно скачивается, хранится декодированным или ждёт
+    детекции не больше окна изображений, поэтому память не растёт с размером пакета.
+    Скачанный URL сразу идёт в обработку, не дожидаясь остальных.
+    """
+    documents = [{"name": name} for name, _ in items]
+    waiting = deque(enumerate(items))
+    fetching = {}  # Future загрузки -> индекс изображения
+    detecting = deque()  # (индекс, ключ кэша, ожидание результата) в порядке отправки
+    window = max(1, Config.BATCH_MAX_IN_FLIGHT)
+
+    def submit(i, image_bytes):
+        if isinstance(image_bytes, Exception):
+            stage = "read archive" if isinstance(image_bytes, ArchiveEntryError) else "load url"
+            documents[i]["error"] = f"{stage}: {str(image_bytes)}"
+            return
+        try:
+            key = cache_key(image_bytes, options, tiling, policy)
+            columns = result_cache.get(key)
+            if columns is not None:
+                documents[i].update(detection_result(columns, columnar))
+                return
+            prepared = prepare_input(image_bytes, tiling, policy)
+        except Exception as e:
+            documents[i]["error"] = f"Invalid image: {str(e)}"
+            return
+        # Изображения окна уходят в планировщик сразу, чтобы он собирал полные пакеты
+        detecting.append((i, key, submit_detection(prepared, options)))
+
+    def fill():
+        while waiting and len(fetching) + len(detecting) < window:
+            i, (name, image_bytes) = waiting.popleft()
+            if image_bytes is not None:
+                submit(i, image_bytes)
+                continue
+            try:
+                fetching[fetcher.submit(name)] = i
+            except QueueFullError as e:
+                submit(i, e)
+
+    fill()
+    while fetching or detecting:
+        # Готовые загрузки обрабатываются в порядке завершения; если ждать детекций нечего — ждём загрузку
+        done, _ = wait_futures(fetching, timeout=0 if detecting else None, return_when=FIRST_COMPLETED)
+        for future in done:
+            submit(fetching.pop(future), future.exception() or future.result())
+        if not done:
+            i, key, wait = detecting.popleft()
+            try:
+                columns = columns_from_results(wait(), label_map)
+                result_cache.put(key, columns)
+                documents[i].update(detection_result(columns, columnar))
+            except Exception as e:
+                documents[i]["error"] = f"Detection failed: {str(e)}"
+        fill()
+
+    failed = sum(1 for document in documents if 'error' in document)
+    return {"images": documents, "total": len(documents), "failed": failed}
+
+@app.route('/api/v1/detect_video', methods=['POST'])
+def api_detect_video():
+    """Детекция на видео или последовательности кадров: результаты по кадрам отдаются потоком NDJSON."""
+    fps = request.args.get('fps', Config.VIDEO_SAMPLE_FPS, type=float)
+    if fps < 0:
+        raise InvalidParameter("fps must not be negative")
+    frame_rate = request.args.get('frame_rate', type=float)
+    if frame_rate is not None and frame_rate <= 0:
+        raise InvalidParameter("frame_rate must be positive")
+    change_threshold = request.args.get('change_threshold', Config.VIDEO_CHANGE_THRESHOLD, type=float)
+    if not 0 <= change_threshold <= 1:
+        raise InvalidParameter("change_threshold must be between 0 and 1")
+    columnar = request.args.get('format') == 'columnar'
+    options = parse_detect_options(request.args)
+    policy = parse_resolution(request.args) or resolution
+
+    upload_path = None
+    if 'video' in request.files:
+        # OpenCV читает видео только из файла, поэтому загрузка сохраняется во временный файл
+        video = request.files['video']
+        with tempfile.NamedTemporaryFile(suffix=os.path.splitext(video.filename or '')[1], delete=False) as f:
+            video.save(f)
+            upload_path = f.name
+        frames = read_video(upload_path)
+    elif request.files.getlist('frames'):
+        frames = read_image_sequence([f.stream for f in request.files.getlist('frames')], frame_rate)
+    elif request.values.get('path'):
+        # Файлы локального архива — только внутри DETECT_VIDEO_DIR
+        if not Config.VIDEO_DIR:
+            return jsonify({"error": "Reading local videos is disabled"}), 400
+        path = safe_join(Config.VIDEO_DIR, request.values['path'])
+        if path is None or not os.path.exists(path):
+            return jsonify({"error": "Video not found"}), 404
+        frames = read_frames(path, frame_rate)
     else:
-        results_store[task_id] = {"detections": detections}
-
-    print("Processing complete for task:", task_id)
+        return jsonify({"error": "No video provided"}), 400
+
+    prepare = lambda image: prepare_frame(image, policy)
+    submit = lambda prepared: scheduler.submit(prepared, options)
+    # Почти неизменившиеся кадры получают детекции предыдущего, трекер переносит id объектов между кадрами
+    gate = FrameGate(change_threshold, Config.VIDEO_MAX_REUSE) if change_threshold > 0 else None
+    tracker = IoUTracker(Config.TRACK_IOU, Config.TRACK_MAX_AGE)
+
+    def stream():
+        count = 0
+        try:
+            for frame, results, reused in detect_frames(sample_frames(frames, fps), submit, prepare, Config.VIDEO_MAX_IN_FLIGHT, gate):
+                count += 1
+                columns = columns_from_results(results, label_map)
+                columns["ids"] = tracker.update(columns)
+                yield json.dumps(frame_record(frame, detection_result(columns, columnar)["detections"], reused)) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": f"Video processing failed: {str(e)}"}) + "\n"
+        yield json.dumps({"done": True, "frames": count}) + "\n"
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    # Кадры из загруженных файлов читаются уже во время ответа: контекст запроса (и файлы) держится открытым
+    response = Response(stream_with_context(stream()), mimetype="application/x-ndjson", headers=headers)
+    if upload_path:
+        # Временный файл удаляется и тогда, когда ответ так и не был прочитан
+        response.call_on_close(lambda: os.remove(upload_path))
+    return response
 
 @app.route('/results')
 def results():
@@ -171,7 +640,17 @@ def results_with_image():
         return render_template('404.html'), 404
     if 'error' in result:
         return render_template('error.html', error=result['error'])
-    return render_template('results_with_image.html', detections=result.get('detections', []), image_url=result.get('image_url', ''))
+    return render_template('results_with_image.html', detections=result.get('detections', []), image_url=result.get('image_url', ''),
+                           source_url=result.get('source_url', ''), upload_key=result.get('upload_key', ''))
+
+@app.route('/metrics')
+def metrics():
+    return jsonify({
+        "cache": result_cache.stats(),
+        "task_queue": worker_pool.pending(),
+        "fetch_queue": fetcher.pool.pending(),
+        "memory": memory_usage(),
+    })
 
 @app.errorhandler(404)
 def page_not_found(e):
@@ -183,4 +662,5 @@ def error():
     return render_template('error.html', error=message)
 
 if __name__ == "__main__":
+    start_services()
     app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
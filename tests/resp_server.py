@@ -0,0 +1,291 @@
+"""Минимальный сервер Redis в памяти процесса для тестов RedisResultStore.
+
+Поддерживает только команды, которые использует хранилище: строки с TTL, хэши, отсортированные
+множества, MULTI/EXEC (конвейер redis-py) и PUBLISH/SUBSCRIBE. Отвечает по RESP2, а после
+HELLO 3 (так по умолчанию подключается redis-py 6+) — по RESP3.
+"""
+import fnmatch
+import socketserver
+import threading
+import time
+
+class Error(Exception):
+    """Ответ сервера с ошибкой (-ERR)."""
+
+class Status(str):
+    """Простая строка ответа (+OK)."""
+
+OK = Status("OK")
+
+class Push(list):
+    """Сообщение подписчику: в RESP3 отправляется как push (>), в RESP2 — как массив."""
+
+def encode(value, resp3=False):
+    if isinstance(value, Status):
+        return b"+" + value.encode() + b"\r\n"
+    if isinstance(value, Error):
+        return b"-ERR " + str(value).encode() + b"\r\n"
+    if value is None:
+        return b"_\r\n" if resp3 else b"$-1\r\n"
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, str):
+        value = value.encode()
+    if isinstance(value, bytes):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    if isinstance(value, dict):
+        if not resp3:
+            return encode([item for pair in value.items() for item in pair])
+        return b"%%%d\r\n" % len(value) + b"".join(encode(k, resp3) + encode(v, resp3) for k, v in value.items())
+    prefix = b">" if resp3 and isinstance(value, Push) else b"*"
+    return prefix + b"%d\r\n" % len(value) + b"".join(encode(item, resp3) for item in value)
+
+def score_bound(value):
+    value = value.decode()
+    if value in ("-inf", "+inf", "inf"):
+        return float(value)
+    if value.startswith("("):
+        raise Error("exclusive ranges are not supported")
+    return float(value)
+
+def number(score):
+    return str(int(score) if score == int(score) else score).encode()
+
+class Database:
+    """Данные сервера: ключ -> значение (bytes, dict или dict member -> score) и срок жизни."""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.values = {}
+        self.expires = {}
+        self.channels = {}  # канал -> множество обработчиков подписчиков
+
+    def _alive(self, key):
+        expires_at = self.expires.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self.values.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.values
+
+    def _get(self, key, kind):
+        if not self._alive(key):
+            return None
+        value = self.values[key]
+        if not isinstance(value, kind):
+            raise Error("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def execute(self, name, args):
+        handler = getattr(self, "cmd_" + name.lower(), None)
+        if handler is None:
+            return Error(f"unknown command '{name}'")
+        try:
+            with self.lock:
+                return handler(*args)
+        except Error as e:
+            return e
+        except (TypeError, ValueError) as e:
+            return Error(str(e))
+
+    def cmd_ping(self, *args):
+        return Status("PONG")
+
+    def cmd_client(self, *args):
+        return OK
+
+    def cmd_select(self, db):
+        return OK
+
+    def cmd_get(self, key):
+        return self._get(key, bytes)
+
+    def cmd_set(self, key, value, *options):
+        self.values[key] = value
+        self.expires.pop(key, None)
+        options = [option.upper() for option in options]
+        if b"EX" in options:
+            self.expires[key] = time.monotonic() + int(options[options.index(b"EX") + 1])
+        return OK
+
+    def cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            if self._alive(key):
+                del self.values[key]
+                self.expires.pop(key, None)
+                removed += 1
+        return removed
+
+    def cmd_expire(self, key, seconds):
+        if not self._alive(key):
+            return 0
+        self.expires[key] = time.monotonic() + int(seconds)
+        return 1
+
+    def cmd_scan(self, cursor, *options):
+        options = list(options)
+        pattern = options[options.index(b"MATCH") + 1].decode() if b"MATCH" in options else "*"
+        keys = [key for key in list(self.values) if self._alive(key) and fnmatch.fnmatchcase(key.decode(), pattern)]
+        return [b"0", keys]
+
+    def cmd_hset(self, key, *pairs):
+        value = self._get(key, dict)
+        if value is None:
+            value = self.values[key] = {}
+        added = sum(1 for field in pairs[::2] if field not in value)
+        value.update(zip(pairs[::2], pairs[1::2]))
+        return added
+
+    def cmd_hmget(self, key, *fields):
+        value = self._get(key, dict) or {}
+        return [value.get(field) for field in fields]
+
+    def _zset(self, key):
+        return self._get(key, dict) or {}
+
+    def _sorted(self, key):
+        return sorted(self._zset(key).items(), key=lambda item: (item[1], item[0]))
+
+    def cmd_zadd(self, key, *pairs):
+        value = self._get(key, dict)
+        if value is None:
+            value = self.values[key] = {}
+        added = 0
+        for score, member in zip(pairs[::2], pairs[1::2]):
+            added += member not in value
+            value[member] = float(score)
+        return added
+
+    def cmd_zcard(self, key):
+        return len(self._zset(key))
+
+    def cmd_zrem(self, key, *members):
+        value = self._zset(key)
+        removed = sum(1 for member in members if value.pop(member, None) is not None)
+        if key in self.values and not value:
+            del self.values[key]
+        return removed
+
+    def cmd_zrange(self, key, start, stop, *options):
+        items = self._sorted(key)
+        start, stop = int(start), int(stop)
+        stop = len(items) + stop if stop < 0 else stop
+        return [member for member, _ in items[start:stop + 1]]
+
+    def cmd_zrangebyscore(self, key, low, high, *options):
+        low, high = score_bound(low), score_bound(high)
+        result = []
+        for member, score in self._sorted(key):
+            if low <= score <= high:
+                result.append(member)
+                if b"WITHSCORES" in (option.upper() for option in options):
+                    result.append(number(score))
+        return result
+
+    def cmd_publish(self, channel, message):
+        subscribers = list(self.channels.get(channel, ()))
+        for deliver in subscribers:
+            deliver(Push([b"message", channel, message]))
+        return len(subscribers)
+
+class Handler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.write_lock = threading.Lock()
+        self.subscriptions = set()
+        self.transaction = None
+        self.resp3 = False
+
+    def send(self, value):
+        with self.write_lock:
+            self.wfile.write(encode(value, self.resp3))
+            self.wfile.flush()
+
+    def deliver(self, message):
+        try:
+            self.send(message)
+        except OSError:
+            pass
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self):
+        db = self.server.db
+        try:
+            while True:
+                args = self.read_command()
+                if args is None:
+                    return
+                if not args:
+                    continue
+                name, args = args[0].decode().upper(), args[1:]
+                if name == "HELLO":
+                    self.resp3 = bool(args) and args[0] == b"3"
+                    self.send({b"server": b"redis", b"version": b"7.0.0", b"proto": 3 if self.resp3 else 2,
+                               b"id": 1, b"mode": b"standalone", b"role": b"master", b"modules": []})
+                elif name == "MULTI":
+                    self.transaction = []
+                    self.send(OK)
+                elif name == "EXEC":
+                    queued, self.transaction = self.transaction or [], None
+                    with db.lock:
+                        self.send([db.execute(command, command_args) for command, command_args in queued])
+                elif name == "DISCARD":
+                    self.transaction = None
+                    self.send(OK)
+                elif self.transaction is not None:
+                    self.transaction.append((name, args))
+                    self.send(Status("QUEUED"))
+                elif name == "SUBSCRIBE":
+                    for channel in args:
+                        with db.lock:
+                            db.channels.setdefault(channel, set()).add(self.deliver)
+                        self.subscriptions.add(channel)
+                        self.send(Push([b"subscribe", channel, len(self.subscriptions)]))
+                elif name == "UNSUBSCRIBE":
+                    for channel in args or list(self.subscriptions):
+                        self.unsubscribe(channel)
+                        self.send(Push([b"unsubscribe", channel, len(self.subscriptions)]))
+                else:
+                    self.send(db.execute(name, args))
+        except (ConnectionError, OSError):
+            return
+        finally:
+            for channel in list(self.subscriptions):
+                self.unsubscribe(channel)
+
+    def unsubscribe(self, channel):
+        self.subscriptions.discard(channel)
+        with self.server.db.lock:
+            self.server.db.channels.get(channel, set()).discard(self.deliver)
+
+class RespServer(socketserver.ThreadingTCPServer):
+    """Сервер на 127.0.0.1 со свободным портом; url — адрес для redis.Redis.from_url."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.db = Database()
+        self.url = f"redis://127.0.0.1:{self.server_address[1]}/0"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="resp-server", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
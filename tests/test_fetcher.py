@@ -0,0 +1,131 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("requests")
+
+from Fetcher import FetchError, UrlFetcher
+
+IMAGE = b"\xff\xd8" + b"\0" * 1000 + b"\xff\xd9"
+
+class Handler(BaseHTTPRequestHandler):
+    """Тестовый сервер: быстрые, медленные, большие и «занятые» ответы."""
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/image":
+            self.send_body(IMAGE)
+        elif path == "/slow":
+            # Заголовки сразу, тело — после паузы длиннее таймаута чтения
+            self.send_headers(len(IMAGE))
+            time.sleep(1)
+            self.wfile.write(IMAGE)
+        elif path == "/trickle":
+            # Данные идут без долгих пауз (кусками по размеру чтения Fetcher), но загрузка целиком длится дольше таймаута
+            self.send_headers(None)
+            for _ in range(20):
+                self.wfile.write(b"\0" * 64 * 1024)
+                self.wfile.flush()
+                time.sleep(0.05)
+        elif path == "/large":
+            self.send_body(b"\0" * 5000)
+        elif path == "/large-stream":
+            # Без Content-Length: размер виден только по мере чтения
+            self.send_headers(None)
+            self.wfile.write(b"\0" * 5000)
+        elif path == "/busy":
+            with self.server.lock:
+                self.server.active += 1
+                self.server.peak = max(self.server.peak, self.server.active)
+            time.sleep(0.2)
+            with self.server.lock:
+                self.server.active -= 1
+            self.send_body(IMAGE)
+        else:
+            self.send_error(404)
+
+    def send_headers(self, length):
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        if length is not None:
+            self.send_header("Content-Length", str(length))
+        self.end_headers()
+
+    def send_body(self, body):
+        self.send_headers(len(body))
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.daemon_threads = True
+    httpd.lock, httpd.active, httpd.peak = threading.Lock(), 0, 0
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+def create_fetcher(**kwargs):
+    fetcher = UrlFetcher(**kwargs)
+    fetcher.start()
+    return fetcher
+
+def test_fetch_image(server):
+    assert create_fetcher().fetch(server.url + "/image") == IMAGE
+
+def test_fetch_rejects_unsupported_url():
+    with pytest.raises(FetchError):
+        create_fetcher().fetch("file:///etc/passwd")
+
+def test_fetch_http_error(server):
+    import requests
+
+    with pytest.raises(requests.HTTPError):
+        create_fetcher().fetch(server.url + "/missing")
+
+def test_read_timeout(server):
+    import requests
+
+    fetcher = create_fetcher(read_timeout=0.2)
+    start = time.monotonic()
+    with pytest.raises((FetchError, requests.RequestException)):
+        fetcher.fetch(server.url + "/slow")
+    assert time.monotonic() - start < 0.9
+
+def test_total_download_timeout(server):
+    fetcher = create_fetcher(read_timeout=0.3)
+    start = time.monotonic()
+    with pytest.raises(FetchError, match="timed out"):
+        fetcher.fetch(server.url + "/trickle")
+    assert time.monotonic() - start < 0.9
+
+def test_byte_cap_by_content_length(server):
+    with pytest.raises(FetchError, match="too large"):
+        create_fetcher(max_bytes=1000).fetch(server.url + "/large")
+
+def test_byte_cap_while_streaming(server):
+    with pytest.raises(FetchError, match="too large"):
+        create_fetcher(max_bytes=1000).fetch(server.url + "/large-stream")
+
+def test_per_host_limit(server):
+    fetcher = create_fetcher(workers=6, per_host=2)
+    futures = [fetcher.submit(server.url + "/busy") for _ in range(6)]
+    assert [future.result(timeout=10) for future in futures] == [IMAGE] * 6
+    assert server.peak == 2
+
+def test_busy_host_does_not_hold_workers(server):
+    # Загрузки сверх лимита хоста ждут вне пула: запрос к другому хосту получает свободный поток сразу
+    fetcher = create_fetcher(workers=2, per_host=1)
+    busy = [fetcher.submit(server.url + "/busy") for _ in range(3)]
+    other = fetcher.submit(server.url.replace("127.0.0.1", "localhost") + "/image")
+    assert other.result(timeout=5) == IMAGE
+    assert not busy[0].done()
+    assert [future.result(timeout=10) for future in busy] == [IMAGE] * 3
+    assert server.peak == 1
@@ -0,0 +1,228 @@
+import os
+import threading
+import time
+import uuid
+
+import pytest
+
+from ResultStore import MemoryResultStore, SQLiteResultStore, RedisResultStore, create_result_store, result_size
+
+def put_later(store, task_id, result, delay=0.1):
+    thread = threading.Thread(target=lambda: (time.sleep(delay), store.put(task_id, result)), daemon=True)
+    thread.start()
+    return thread
+
+def timed_wait(store, task_id, timeout):
+    start = time.monotonic()
+    result = store.wait(task_id, timeout)
+    return result, time.monotonic() - start
+
+class Evictions:
+    """Запоминает вытесненные задачи (обработчик on_evict)."""
+
+    def __init__(self):
+        self.items = []
+
+    def __call__(self, task_id, result):
+        self.items.append((task_id, result))
+
+    @property
+    def ids(self):
+        return [task_id for task_id, _ in self.items]
+
+# Хранилище в памяти
+
+def test_memory_put_get():
+    store = MemoryResultStore()
+    store.put("a", {"status": "done"})
+    assert store.get("a") == {"status": "done"}
+    assert store.get("missing") is None
+
+def test_memory_ttl_expires_result():
+    evictions = Evictions()
+    store = MemoryResultStore(ttl=0.05, on_evict=evictions)
+    store.put("a", {"n": 1})
+    store.put("b", {"n": 2})
+    time.sleep(0.1)
+    assert store.get("a") is None
+    assert store.sweep() == 1
+    assert len(store) == 0
+    assert sorted(evictions.ids) == ["a", "b"]
+
+def test_memory_lru_evicts_least_recently_used():
+    evictions = Evictions()
+    store = MemoryResultStore(max_items=2, on_evict=evictions)
+    store.put("a", {"n": 1})
+    store.put("b", {"n": 2})
+    store.get("a")
+    store.put("c", {"n": 3})
+    assert evictions.items == [("b", {"n": 2})]
+    assert store.get("a") == {"n": 1}
+    assert store.get("c") == {"n": 3}
+
+def test_memory_byte_cap_counts_blobs():
+    result = {"data": "x" * 100}
+    evictions = Evictions()
+    store = MemoryResultStore(max_bytes=result_size(result) + 150, on_evict=evictions)
+    store.put("a", result)
+    store.put_blob("a", b"\0" * 200, "image/jpeg")
+    # Результат и изображение вместе превышают лимит: вытесняется самая старая запись
+    assert evictions.ids == ["a"]
+    assert store.get("a") is None
+    assert store.get_blob("a") == (b"\0" * 200, "image/jpeg")
+
+def test_memory_keeps_single_oversized_item():
+    store = MemoryResultStore(max_bytes=10)
+    store.put("a", {"data": "x" * 100})
+    assert store.get("a") == {"data": "x" * 100}
+
+def test_memory_wait_wakes_up_on_put():
+    store = MemoryResultStore()
+    put_later(store, "a", {"n": 1})
+    result, elapsed = timed_wait(store, "a", timeout=5)
+    assert result == {"n": 1}
+    assert elapsed < 1
+
+def test_memory_wait_times_out():
+    store = MemoryResultStore()
+    result, elapsed = timed_wait(store, "a", timeout=0.1)
+    assert result is None
+    assert elapsed >= 0.1
+
+# SQLite
+
+@pytest.fixture
+def sqlite_path(tmp_path):
+    return str(tmp_path / "results.db")
+
+def test_sqlite_put_get_shared_between_stores(sqlite_path):
+    SQLiteResultStore(sqlite_path).put("a", {"labels": ["кошка"]})
+    # Другой экземпляр (как другой процесс) видит тот же результат
+    assert SQLiteResultStore(sqlite_path).get("a") == {"labels": ["кошка"]}
+
+def test_sqlite_ttl_expires_result(sqlite_path):
+    evictions = Evictions()
+    store = SQLiteResultStore(sqlite_path, ttl=0.05, on_evict=evictions)
+    store.put("a", {"n": 1})
+    store.put_blob("a", b"image", "image/jpeg")
+    time.sleep(0.1)
+    assert store.get("a") is None
+    assert store.get_blob("a") is None
+    assert store.sweep() == 1
+    assert evictions.items == [("a", {"n": 1})]
+
+def test_sqlite_max_items_evicts_least_recently_used(sqlite_path):
+    evictions = Evictions()
+    store = SQLiteResultStore(sqlite_path, max_items=2, on_evict=evictions)
+    for task_id in ("a", "b", "c"):
+        store.put(task_id, {"id": task_id})
+        time.sleep(0.01)
+    store.get("a")
+    assert store.sweep() == 1
+    assert evictions.ids == ["b"]
+    assert store.get("a") == {"id": "a"}
+    assert store.get("c") == {"id": "c"}
+
+def test_sqlite_byte_cap_counts_blobs(sqlite_path):
+    evictions = Evictions()
+    store = SQLiteResultStore(sqlite_path, max_bytes=1000, on_evict=evictions)
+    store.put_blob("old", b"\0" * 600, "image/jpeg")
+    time.sleep(0.01)
+    store.put("a", {"n": 1})
+    store.put_blob("new", b"\0" * 600, "image/png")
+    store.sweep()
+    # Два изображения не помещаются в лимит: удаляется записанное раньше
+    assert store.get_blob("old") is None
+    assert store.get_blob("new") == (b"\0" * 600, "image/png")
+    assert store.get("a") == {"n": 1}
+    assert evictions.items == []
+
+def test_sqlite_wait_wakes_up_on_put(sqlite_path):
+    store = SQLiteResultStore(sqlite_path)
+    store.poll_interval = 0.02
+    put_later(store, "a", {"n": 1})
+    result, elapsed = timed_wait(store, "a", timeout=5)
+    assert result == {"n": 1}
+    assert elapsed < 1
+
+def test_sqlite_wait_times_out(sqlite_path):
+    store = SQLiteResultStore(sqlite_path)
+    result, elapsed = timed_wait(store, "a", timeout=0.1)
+    assert result is None
+    assert elapsed >= 0.1
+
+def test_create_result_store(sqlite_path):
+    assert isinstance(create_result_store("memory://"), MemoryResultStore)
+    assert isinstance(create_result_store("sqlite:///" + sqlite_path), SQLiteResultStore)
+    with pytest.raises(ValueError):
+        create_result_store("ftp://results")
+
+# Redis: по умолчанию — сервер-заглушка в процессе (tests/resp_server.py); настоящий сервер
+# можно задать в DETECT_TEST_REDIS_URL (например, redis://localhost:6379/15)
+
+@pytest.fixture
+def redis_store():
+    pytest.importorskip("redis")
+    url = os.environ.get("DETECT_TEST_REDIS_URL")
+    server = None
+    if not url:
+        from resp_server import RespServer
+
+        server = RespServer().start()
+        url = server.url
+    prefix = f"detect-test-{uuid.uuid4().hex}:"
+    stores = []
+
+    def create(**kwargs):
+        store = RedisResultStore(url, prefix=prefix, **kwargs)
+        stores.append(store)
+        return store
+
+    yield create
+    for store in stores:
+        keys = list(store.client.scan_iter(prefix + "*"))
+        if keys:
+            store.client.delete(*keys)
+        store.client.close()
+    if server is not None:
+        server.stop()
+
+def test_redis_put_get(redis_store):
+    store = redis_store()
+    store.put("a", {"n": 1})
+    store.put_blob("a", b"image", "image/jpeg")
+    assert store.get("a") == {"n": 1}
+    assert store.get_blob("a") == (b"image", "image/jpeg")
+    assert store.get("missing") is None
+
+def test_redis_ttl_expires_result(redis_store):
+    evictions = Evictions()
+    store = redis_store(ttl=1, on_evict=evictions)
+    store.put("a", {"n": 1})
+    time.sleep(1.1)
+    assert store.get("a") is None
+    assert store.sweep() == 1
+    assert evictions.items == [("a", {"n": 1})]
+
+def test_redis_max_items_evicts_oldest(redis_store):
+    evictions = Evictions()
+    store = redis_store(max_items=2, on_evict=evictions)
+    for task_id in ("a", "b", "c"):
+        store.put(task_id, {"id": task_id})
+        time.sleep(0.01)
+    assert store.sweep() == 1
+    assert evictions.ids == ["a"]
+    assert store.get("c") == {"id": "c"}
+
+def test_redis_wait_wakes_up_on_put(redis_store):
+    store = redis_store()
+    put_later(store, "a", {"n": 1})
+    result, elapsed = timed_wait(store, "a", timeout=5)
+    assert result == {"n": 1}
+    assert elapsed < 1
+
+def test_redis_wait_times_out(redis_store):
+    store = redis_store()
+    result, elapsed = timed_wait(store, "a", timeout=0.1)
+    assert result is None
+    assert elapsed >= 0.1